@@ -13,6 +13,7 @@ It demonstrates:
 
 """
 
+import numpy as np
 import wgpu
 from wgpu.gui.auto import WgpuCanvas, run
 import pygfx as gfx
@@ -28,23 +29,53 @@ class Triangle(gfx.WorldObject):
 
 class TriangleMaterial(gfx.Material):
 
+    # The color is packed as rgba8 in a single u32, since it ends up in an
+    # 8-bit render target anyway. Use unpack4x8unorm() in the shader.
+    # The opacity is applied to the alpha of the packed color, so that the
+    # fragment shader can use it as-is.
     uniform_type = dict(
-        color="4xf4",
+        color="u4",
     )
 
     def __init__(self, *, color="white", **kwargs):
+        # Set the color before the base class sets the opacity, which
+        # writes the packed color to the (fresh) uniform buffer.
+        self._color_rgba = self._to_rgba(color)
+        self._color = None  # Color object, created on demand
         super().__init__(**kwargs)
-        self.color = color
+
+    @gfx.Material.opacity.setter
+    def opacity(self, value):
+        gfx.Material.opacity.fset(self, value)
+        self._write_color()
 
     @property
     def color(self):
         """The uniform color of the triangle."""
-        return gfx.Color(self.uniform_buffer.data["color"])
+        if self._color is None:
+            self._color = gfx.Color(self._color_rgba)
+        return self._color
 
     @color.setter
     def color(self, color):
-        self.uniform_buffer.data["color"] = gfx.Color(color)
-        self.uniform_buffer.update_range(0, 99999)
+        self._color_rgba = self._to_rgba(color)
+        self._color = None
+        self._write_color()
+        self.uniform_buffer.update_range(0, 1)
+
+    @staticmethod
+    def _to_rgba(color):
+        if isinstance(color, (tuple, list, np.ndarray)) and len(color) == 4:
+            # Fast path for rgba values, avoiding the creation of a Color object
+            return tuple(min(max(float(c), 0.0), 1.0) for c in color)
+        else:
+            return gfx.Color(color).rgba
+
+    def _write_color(self):
+        r, g, b, a = self._color_rgba
+        a *= self.opacity
+        r, g, b, a = (int(c * 255 + 0.5) for c in (r, g, b, a))
+        self.uniform_buffer.data["color"] = r | (g << 8) | (b << 16) | (a << 24)
 
 
 @gfx.renderers.wgpu.register_wgpu_render_function(Triangle, TriangleMaterial)
@@ -52,8 +83,18 @@ class TriangleShader(WorldObjectShader):
 
     type = "render"
 
+    # Note that the methods below are not called for each draw. The renderer
+    # tracks which attributes they use, and only calls them again when one
+    # of these changes. The compiled shader module and pipeline are cached
+    # (per environment) in the meantime, so there is no need to cache them here.
+
     def get_resources(self, wobject, shared):
-        # We now use three uniform buffers
+        # The number of vertices is a templating variable, so that the shader
+        # is specialized for it. It's also used in get_render_info().
+        self["n_vertices"] = 3
+
+        # We now use three uniform buffers. The bind group that is created
+        # from these is re-used until one of the buffers is replaced.
         bindings = {
             0: Binding("u_stdinfo", "buffer/uniform", shared.uniform_buffer),
             1: Binding("u_wobject", "buffer/uniform", wobject.uniform_buffer),
@@ -78,7 +119,7 @@ class TriangleShader(WorldObjectShader):
     def get_render_info(self, wobject, shared):
         # Since we draw only one triangle we need just 3 vertices.
         return {
-            "indices": (3, 1),
+            "indices": (self["n_vertices"], 1),
             "render_mask": RenderMask.all,  # Good default
         }
 
@@ -92,21 +133,24 @@ class TriangleShader(WorldObjectShader):
 
     def code_vertex(self):
         return """
+        // List of relative positions, in logical pixels. Defined at module
+        // scope, so it's initialized once instead of in each invocation.
+        // Note that a module-scope let cannot be indexed dynamically (yet).
+        var<private> positions: array<vec2<f32>, {{ n_vertices }}> = array<vec2<f32>, {{ n_vertices }}>(
+            vec2<f32>(0.0, -20.0), vec2<f32>(-17.0, 15.0), vec2<f32>(17.0, 15.0)
+        );
+
         @stage(vertex)
         fn vs_main(@builtin(vertex_index) index: u32) -> Varyings {
             // Transform object positition into NDC coords
             let model_pos = vec4<f32>(0.0, 0.0, 0.0, 1.0);
             let world_pos = u_wobject.world_transform * model_pos;
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
-
-            // List of relative positions, in logical pixels
-            var positions = array<vec2<f32>, 3>(
-                vec2<f32>(0.0, -20.0), vec2<f32>(-17.0, 15.0), vec2<f32>(17.0, 15.0)
-            );
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
-            // Get position for *this* corner
-            let screen_factor = u_stdinfo.logical_size.xy / 2.0;
-            let screen_pos_ndc = ndc_pos.xy + positions[index] / screen_factor;
+            // Get position for *this* corner. The offsets are converted to NDC
+            // here (rather than being stored in NDC in the material), because
+            // a material can be rendered to targets that differ in size.
+            let screen_pos_ndc = ndc_pos.xy + positions[index] * u_stdinfo.inv_half_logical_size;
 
             // Set the output
             var varyings: Varyings;
@@ -120,8 +164,7 @@ class TriangleShader(WorldObjectShader):
         @stage(fragment)
         fn fs_main(varyings: Varyings) -> FragmentOutput {
             var out: FragmentOutput;
-            let a = u_material.color.a * u_material.opacity;
-            out.color = vec4<f32>(u_material.color.rgb, a);
+            out.color = unpack4x8unorm(u_material.color);
             return out;
         }
         """
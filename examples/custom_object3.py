@@ -9,6 +9,7 @@ It demonstrates:
 * The use of uniforms for material properties.
 * The implementation of the camera transforms in the shader.
 * How geometry (vertex data) can be used in the shader.
+* Instanced drawing, to draw all triangles with a single draw call.
 * Shader templating.
 
 """
@@ -46,7 +47,7 @@ class TriangleMaterial(gfx.Material):
     def color(self, color):
         color = gfx.Color(color)
         self.uniform_buffer.data["color"] = color
-        self.uniform_buffer.update_range(0, 99999)
+        self.uniform_buffer.update_range(0, 1)
         self._store.color_is_transparent = color.a < 1
 
     @property
@@ -98,8 +99,9 @@ class TriangleShader(WorldObjectShader):
         material = wobject.material
         geometry = wobject.geometry
 
-        # Determine number of vertices
-        n = 3 * geometry.positions.nitems
+        # We draw one instance (of 3 vertices) per triangle, so that all
+        # triangles are drawn with a single (instanced) draw call.
+        n = geometry.positions.nitems
 
         # Define in what passes this object is drawn.
         # Using RenderMask.all is a good default. The rest is optimization.
@@ -114,7 +116,7 @@ class TriangleShader(WorldObjectShader):
                 render_mask = RenderMask.opaque
 
         return {
-            "indices": (n, 1),
+            "indices": (3, n),
             "render_mask": render_mask,
         }
 
@@ -129,15 +131,15 @@ class TriangleShader(WorldObjectShader):
     def code_vertex(self):
         return """
         @stage(vertex)
-        fn vs_main(@builtin(vertex_index) index: u32) -> Varyings {
+        fn vs_main(@builtin(vertex_index) index: u32, @builtin(instance_index) instance_index: u32) -> Varyings {
 
-            let vertex_index = i32(index) / 3;
-            let sub_index = i32(index) % 3;
+            let vertex_index = i32(instance_index);
+            let sub_index = i32(index);
 
             // Transform object positition into NDC coords
             let model_pos = load_s_positions(vertex_index);  // vec3
             let world_pos = u_wobject.world_transform * vec4<f32>(model_pos, 1.0);
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             // List of relative positions, in logical pixels
             var positions = array<vec2<f32>, 3>(
@@ -145,8 +147,7 @@ class TriangleShader(WorldObjectShader):
             );
 
             // Get position for *this* corner
-            let screen_factor = u_stdinfo.logical_size.xy / 2.0;
-            let screen_pos_ndc = ndc_pos.xy + {{scale}} * positions[sub_index] / screen_factor;
+            let screen_pos_ndc = ndc_pos.xy + {{scale}} * positions[sub_index] * u_stdinfo.inv_half_logical_size;
 
             // Set the output
             var varyings: Varyings;
@@ -11,6 +11,7 @@ class Material(Trackable):
     uniform_type = dict(
         opacity="f4",
         clipping_planes="0*4xf4",  # array<vec4<f32>,3>
+        clipping_mode="u4",  # 0 for ANY, 1 for ALL
     )
 
     def __init__(self, *, opacity=1, clipping_planes=None, clipping_mode="any"):
@@ -147,3 +148,7 @@ class Material(Trackable):
             self._clipping_mode = mode
         else:
             raise ValueError(f"Unexpected clipping_mode: {value}")
+        # The mode is a uniform, so that it can be changed without
+        # recompiling the shader.
+        self.uniform_buffer.data["clipping_mode"] = mode == "ALL"
+        self.uniform_buffer.update_range(0, 1)
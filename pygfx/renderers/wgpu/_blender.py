@@ -271,6 +271,24 @@ class WeightedTransparencyPass(BasePass):
 
     render_mask = 2  # transparent only
 
+    # The shader code is composed once, in __init__
+    _shader_template = """
+        struct FragmentOutput {
+            @location(0) accum: vec4<f32>,
+            @location(1) reveal: f32,
+        };
+        fn get_fragment_output(depth: f32, color: vec4<f32>) -> FragmentOutput {
+            if (color.a <= alpha_compare_epsilon) { discard; }
+            let premultiplied = color.rgb * color.a;
+            let alpha = color.a;  // could take user-specified transmittance into account
+            WEIGHT_CODE
+            var out : FragmentOutput;
+            out.accum = vec4<f32>(premultiplied, alpha) * weight;
+            out.reveal = alpha;
+            return out;
+        }
+        """
+
     def __init__(self, weight_func):
 
         if weight_func == "alpha":
@@ -291,6 +309,9 @@ class WeightedTransparencyPass(BasePass):
             )
 
         self._weight_code = weight_code.strip()
+        self._shader_code = self._shader_template.replace(
+            "WEIGHT_CODE", self._weight_code
+        )
 
     def get_color_descriptors(self, blender):
         bf, bo = wgpu.BlendFactor, wgpu.BlendOperation
@@ -349,24 +370,7 @@ class WeightedTransparencyPass(BasePass):
         }
 
     def get_shader_code(self, blender):
-        return """
-        struct FragmentOutput {
-            @location(0) accum: vec4<f32>,
-            @location(1) reveal: f32,
-        };
-        fn get_fragment_output(depth: f32, color: vec4<f32>) -> FragmentOutput {
-            if (color.a <= alpha_compare_epsilon) { discard; }
-            let premultiplied = color.rgb * color.a;
-            let alpha = color.a;  // could take user-specified transmittance into account
-            WEIGHT_CODE
-            var out : FragmentOutput;
-            out.accum = vec4<f32>(premultiplied, alpha) * weight;
-            out.reveal = alpha;
-            return out;
-        }
-        """.replace(
-            "WEIGHT_CODE", self._weight_code
-        )
+        return self._shader_code
 
 
 class FrontmostTransparencyPass(BasePass):
@@ -86,7 +86,7 @@ class Environment(Trackable):
     def clear(self):
         """Remove all wgpu objects associated with this environment."""
         for pipeline_container in self._pipeline_containers:
-            pipeline_container.remove_env_hash(self.hash)
+            pipeline_container.remove_env_hash(id(self))
         self._pipeline_containers.clear()
         self._renderers.clear()
         self._scenes.clear()
@@ -4,6 +4,11 @@ This object is responsible for creating the native wgpu objects and doing the
 actual dispatching / drawing.
 """
 
+import hashlib
+import logging
+import weakref
+import collections
+
 import wgpu
 
 from ...resources import Buffer, TextureView
@@ -20,6 +25,31 @@ visibility_all = (
 )
 
 
+def _enum_to_dict(enum):
+    """Get a dict that maps the field names of a wgpu enum (or flag) to
+    their values. Looking up in a dict is faster than a getattr.
+    """
+    return {key: getattr(enum, key) for key in dir(enum) if not key.startswith("_")}
+
+
+_shader_stages = _enum_to_dict(wgpu.ShaderStage)
+_texture_view_dims = _enum_to_dict(wgpu.TextureViewDimension)
+_binding_subtypes = {
+    "buffer": _enum_to_dict(wgpu.BufferBindingType),
+    "sampler": _enum_to_dict(wgpu.SamplerBindingType),
+    "texture": _enum_to_dict(wgpu.TextureSampleType),
+    "storage_texture": _enum_to_dict(wgpu.StorageTextureAccess),
+}
+
+
+# The attributes that hold the (version, wgpu_object) of a resource
+_resource_attrs = {
+    kind: "_wgpu_" + kind for kind in ("buffer", "sampler", "texture", "texture_view")
+}
+_no_version = (-1, None)
+_no_dynamic_offsets = ()
+
+
 def get_pipeline_container_group(wobject, environment, shared):
     """Update the GPU objects associated with the given wobject. Returns
     quickly if no changes are needed. Only this function is used by the
@@ -44,8 +74,8 @@ def get_pipeline_container_group(wobject, environment, shared):
     # should typically be small.
     # todo: (in another PR). Keep track of resources that need an update globally, and let the renderer flush that on each draw
     flat_resources = pipeline_container_group.get_flat_resources()
-    for kind, resource in flat_resources:
-        our_version = getattr(resource, "_wgpu_" + kind, (-1, None))[0]
+    for kind, resource, attr in flat_resources:
+        our_version = getattr(resource, attr, _no_version)[0]
         if resource.rev > our_version:
             update_resource(shared.device, resource, kind)
 
@@ -64,100 +94,159 @@ class Binding:
     * visibility: wgpu.ShaderStage flag
     """
 
+    __slots__ = ["name", "type", "resource", "visibility", "_type_prefix", "_subtype"]
+
     def __init__(self, name, type, resource, visibility=visibility_render):
         if isinstance(visibility, str):
-            visibility = getattr(wgpu.ShaderStage, visibility)
+            visibility = _shader_stages[visibility]
         self.name = name
         self.type = type
         self.resource = resource
         self.visibility = visibility
+        # Resolve the type once, so that getting the descriptors is cheap
+        prefix, _, subtype = type.partition("/")
+        self._type_prefix = prefix
+        self._subtype = _binding_subtypes.get(prefix, {}).get(subtype, subtype)
 
     def get_bind_group_descriptors(self, slot):
-        resource = self.resource
-        subtype = self.type.partition("/")[2]
-
-        if self.type.startswith("buffer/"):
-            assert isinstance(resource, Buffer)
-            binding = {
-                "binding": slot,
-                "resource": {
-                    "buffer": resource._wgpu_buffer[1],
-                    "offset": 0,
-                    "size": resource.nbytes,
-                },
-            }
-            binding_layout = {
-                "binding": slot,
-                "visibility": self.visibility,
-                "buffer": {
-                    "type": getattr(wgpu.BufferBindingType, subtype),
-                    "has_dynamic_offset": False,
-                    "min_binding_size": 0,
-                },
-            }
-        elif self.type.startswith("sampler/"):
-            assert isinstance(resource, TextureView)
-            binding = {"binding": slot, "resource": resource._wgpu_sampler[1]}
-            binding_layout = {
-                "binding": slot,
-                "visibility": self.visibility,
-                "sampler": {
-                    "type": getattr(wgpu.SamplerBindingType, subtype),
-                },
-            }
-        elif self.type.startswith("texture/"):
-            assert isinstance(resource, TextureView)
-            binding = {"binding": slot, "resource": resource._wgpu_texture_view[1]}
-            dim = resource.view_dim
-            dim = getattr(wgpu.TextureViewDimension, dim, dim)
-            sample_type = getattr(wgpu.TextureSampleType, subtype, subtype)
-            # Derive sample type from texture
-            if sample_type == "auto":
-                fmt = to_texture_format(resource.format)
-                fmt = ALTTEXFORMAT.get(fmt, [fmt])[0]
-                if "float" in fmt or "norm" in fmt:
-                    sample_type = wgpu.TextureSampleType.float
-                    # For float32 wgpu does not allow the sampler to be filterable,
-                    # except when the native-only feature
-                    # TEXTURE_ADAPTER_SPECIFIC_FORMAT_FEATURES is set,
-                    # which wgpu-py does by default.
-                    # if "32float" in fmt:
-                    #     sample_type = wgpu.TextureSampleType.unfilterable_float
-                elif "uint" in fmt:
-                    sample_type = wgpu.TextureSampleType.uint
-                elif "sint" in fmt:
-                    sample_type = wgpu.TextureSampleType.sint
-                elif "depth" in fmt:
-                    sample_type = wgpu.TextureSampleType.depth
-                else:
-                    raise ValueError("Could not determine texture sample type.")
-            binding_layout = {
-                "binding": slot,
-                "visibility": self.visibility,
-                "texture": {
-                    "sample_type": sample_type,
-                    "view_dimension": dim,
-                    "multisampled": False,
-                },
-            }
-        elif self.type.startswith("storage_texture/"):
-            assert isinstance(resource, TextureView)
-            binding = {"binding": slot, "resource": resource._wgpu_texture_view[1]}
-            dim = resource.view_dim
-            dim = getattr(wgpu.TextureViewDimension, dim, dim)
-            fmt = to_texture_format(resource.format)
-            fmt = ALTTEXFORMAT.get(fmt, [fmt])[0]
-            binding_layout = {
-                "binding": slot,
-                "visibility": self.visibility,
-                "storage_texture": {
-                    "access": getattr(wgpu.StorageTextureAccess, subtype),
-                    "format": fmt,
-                    "view_dimension": dim,
-                },
-            }
+        return _bind_group_descriptor_funcs[self._type_prefix](self, slot)
+
+
+def _get_buffer_descriptors(binding, slot):
+    resource = binding.resource
+    assert isinstance(resource, Buffer)
+    binding_des = {
+        "binding": slot,
+        "resource": {
+            "buffer": resource._wgpu_buffer[1],
+            "offset": 0,
+            "size": resource.nbytes,
+        },
+    }
+    binding_layout = {
+        "binding": slot,
+        "visibility": binding.visibility,
+        "buffer": {
+            "type": binding._subtype,
+            "has_dynamic_offset": False,
+            "min_binding_size": 0,
+        },
+    }
+    return binding_des, binding_layout
+
+
+def _get_sampler_descriptors(binding, slot):
+    resource = binding.resource
+    assert isinstance(resource, TextureView)
+    binding_des = {"binding": slot, "resource": resource._wgpu_sampler[1]}
+    binding_layout = {
+        "binding": slot,
+        "visibility": binding.visibility,
+        "sampler": {
+            "type": binding._subtype,
+        },
+    }
+    return binding_des, binding_layout
+
+
+def _get_texture_descriptors(binding, slot):
+    resource = binding.resource
+    assert isinstance(resource, TextureView)
+    binding_des = {"binding": slot, "resource": resource._wgpu_texture_view[1]}
+    dim = resource.view_dim
+    dim = _texture_view_dims.get(dim, dim)
+    sample_type = binding._subtype
+    if sample_type == "auto":
+        sample_type = _get_sample_type(resource.format)
+    binding_layout = {
+        "binding": slot,
+        "visibility": binding.visibility,
+        "texture": {
+            "sample_type": sample_type,
+            "view_dimension": dim,
+            "multisampled": False,
+        },
+    }
+    return binding_des, binding_layout
+
+
+def _get_storage_texture_descriptors(binding, slot):
+    resource = binding.resource
+    assert isinstance(resource, TextureView)
+    binding_des = {"binding": slot, "resource": resource._wgpu_texture_view[1]}
+    dim = resource.view_dim
+    dim = _texture_view_dims.get(dim, dim)
+    fmt = to_texture_format(resource.format)
+    fmt = ALTTEXFORMAT.get(fmt, [fmt])[0]
+    binding_layout = {
+        "binding": slot,
+        "visibility": binding.visibility,
+        "storage_texture": {
+            "access": binding._subtype,
+            "format": fmt,
+            "view_dimension": dim,
+        },
+    }
+    return binding_des, binding_layout
+
+
+_bind_group_descriptor_funcs = {
+    "buffer": _get_buffer_descriptors,
+    "sampler": _get_sampler_descriptors,
+    "texture": _get_texture_descriptors,
+    "storage_texture": _get_storage_texture_descriptors,
+}
+
+_sample_types = {}
+
+
+def _get_sample_type(format):
+    """Derive the sample type from a texture format."""
+    try:
+        return _sample_types[format]
+    except KeyError:
+        pass
+    fmt = to_texture_format(format)
+    fmt = ALTTEXFORMAT.get(fmt, [fmt])[0]
+    if "float" in fmt or "norm" in fmt:
+        sample_type = wgpu.TextureSampleType.float
+        # For float32 wgpu does not allow the sampler to be filterable,
+        # except when the native-only feature
+        # TEXTURE_ADAPTER_SPECIFIC_FORMAT_FEATURES is set,
+        # which wgpu-py does by default.
+        # if "32float" in fmt:
+        #     sample_type = wgpu.TextureSampleType.unfilterable_float
+    elif "uint" in fmt:
+        sample_type = wgpu.TextureSampleType.uint
+    elif "sint" in fmt:
+        sample_type = wgpu.TextureSampleType.sint
+    elif "depth" in fmt:
+        sample_type = wgpu.TextureSampleType.depth
+    else:
+        raise ValueError("Could not determine texture sample type.")
+    _sample_types[format] = sample_type
+    return sample_type
+
+
+def _get_layout_key(binding):
+    """Get a key for the properties of a binding that affect its layout."""
+    if binding._type_prefix in ("texture", "storage_texture"):
+        resource = binding.resource
+        return binding.type, binding.visibility, resource.view_dim, resource.format
+    else:
+        return binding.type, binding.visibility
+
 
-        return binding, binding_layout
+def _get_bind_group_entry_key(entry):
+    """Get a key for a bind group entry, which identifies the native
+    object that it refers to.
+    """
+    resource = entry["resource"]
+    if isinstance(resource, dict):
+        resource = id(resource["buffer"]), resource["offset"], resource["size"]
+    else:
+        resource = id(resource)
+    return entry["binding"], resource
 
 
 class PipelineContainerGroup:
@@ -169,12 +258,17 @@ class PipelineContainerGroup:
     def __init__(self):
         self.compute_containers = None
         self.render_containers = None
+        self._flat_resources = None
 
     def update(self, wobject, environment, shared, changed):
         """Update the pipeline containers that are wrapped. Creates (and re-creates)
         the containers if necessary.
         """
 
+        # The flat resources of the containers only change when they update
+        if changed:
+            self._flat_resources = None
+
         if "create" in changed:
             self.compute_containers = []
             self.render_containers = []
@@ -211,11 +305,14 @@ class PipelineContainerGroup:
 
     def get_flat_resources(self):
         """Get a set of the combined resources of all pipeline containers."""
-        flat_resources = set()
-        for container in self.compute_containers:
-            flat_resources.update(container.flat_resources)
-        for container in self.render_containers:
-            flat_resources.update(container.flat_resources)
+        # This is called for each draw, so we cache the result.
+        flat_resources = self._flat_resources
+        if flat_resources is None:
+            flat_resources = frozenset().union(
+                *(c.flat_resources for c in self.compute_containers),
+                *(c.flat_resources for c in self.render_containers),
+            )
+            self._flat_resources = flat_resources
         return flat_resources
 
 
@@ -235,21 +332,30 @@ class PipelineContainer:
         self.render_info = None
 
         # The wgpu objects that we generate
-        # These map blend_mode to a list of objects (one for each pass).
-        # For compute shaders the blend_mode is always "" and there is
-        # one object in each.
+        # These map the environment id to a dict of objects (one for each
+        # pass). For compute shaders the environment id is always 0 and
+        # there is one object in each.
         self.wgpu_shaders = {}
         self.wgpu_pipelines = {}
+        # Set to invalidate the pipelines (of all envs) on the next update
+        self._pipelines_invalid = False
 
         # The bindings map group_index -> group
         self.bind_group_layout_descriptors = []
         self.wgpu_bind_group_layouts = []
         self.wgpu_bind_groups = []
+        self._bind_group_layout_key = None
+        self._bind_group_key = None
+        self._bind_group_args = ()
+        self._sorted_bindings = ()
 
-        # A flat list of all buffers, textures, samplers etc. in use.
+        # A flat set of all buffers, textures, samplers etc. in use.
         # This is to allow fast iteration for updating the resources
-        # (uploading new data to buffers and textures).
-        self.flat_resources = []
+        # (uploading new data to buffers and textures). A frozenset,
+        # so that the group can combine these without copying. The elements
+        # are (kind, resource, attr) tuples, where attr is the name of the
+        # attribute that holds the resource's (version, wgpu_object).
+        self.flat_resources = frozenset()
 
         # A flag to indicate that an error occured and we cannot dispatch
         self.broken = False
@@ -265,10 +371,13 @@ class PipelineContainer:
     def update(self, wobject, environment, shared, changed):
         """Make sure that the pipeline is up-to-date."""
 
+        # The wgpu objects are keyed by the id of the environment, which is
+        # cheaper than its hash. The environment removes its entries (via
+        # remove_env_hash) when it becomes inactive, before it is released.
         if isinstance(self, RenderPipelineContainer):
-            env_hash = environment.hash
+            env_hash = id(environment)
         else:
-            env_hash = ""
+            env_hash = 0
 
         # Ensure that the information provided by the shader is up-to-date
         if changed:
@@ -290,8 +399,8 @@ class PipelineContainer:
             else:
                 self.broken = False
 
-        if changed:
-            logger.info(f"{wobject} shader update: {', '.join(sorted(changed))}.")
+        if changed and logger.isEnabledFor(logging.INFO):
+            logger.info("%s shader update: %s.", wobject, ", ".join(sorted(changed)))
 
     def update_shader_data(self, wobject, shared, changed):
         """Update the info that applies to all passes and environments."""
@@ -302,34 +411,74 @@ class PipelineContainer:
         if "resources" in changed:
             with wobject.tracker.track_usage("!resources"):
                 self.resources = self.shader.get_resources(wobject, shared)
-            self.flat_resources = self.collect_flat_resources()
-            for kind, resource in self.flat_resources:
+            pipeline_resources = self.collect_flat_resources()
+            self.flat_resources = frozenset(
+                (kind, resource, _resource_attrs[kind])
+                for kind, resource in pipeline_resources
+            )
+            for kind, resource in pipeline_resources:
                 update_resource(shared.device, resource, kind)
-            self._check_resources()
+            if __debug__:
+                self._check_resources()
+            self._process_resources()
             self.update_shader_hash()
             self.update_bind_groups(shared.device)
 
         if "pipeline_info" in changed:
             with wobject.tracker.track_usage("pipeline_info"):
                 self.pipeline_info = self.shader.get_pipeline_info(wobject, shared)
-            self._check_pipeline_info()
+            if __debug__:
+                self._check_pipeline_info()
+            self._process_pipeline_info()
             changed.add("render_info")
-            self.wgpu_pipelines = {}
+            self._pipelines_invalid = True
 
         if "render_info" in changed:
             with wobject.tracker.track_usage("render_info"):
                 self.render_info = self.shader.get_render_info(wobject, shared)
-            self._check_render_info()
+            if __debug__:
+                self._check_render_info()
+            self._process_render_info()
+
+    def _process_resources(self):
+        """Process the resources, after they have been (re)obtained."""
+        # Sort the bindings by group and slot, as a tuple of tuples
+        self._sorted_bindings = tuple(
+            (group_id, tuple(sorted(group.items())))
+            for group_id, group in sorted(self.resources["bindings"].items())
+        )
+
+    def _check_bindings(self):
+        for i, group in self.resources["bindings"].items():
+            assert isinstance(i, int)
+            assert isinstance(group, dict)
+            for j, b in group.items():
+                assert isinstance(j, int)
+                assert isinstance(b, Binding)
+
+    def _process_pipeline_info(self):
+        """Process the pipeline info, after it has been (re)obtained."""
+        pass
+
+    def _process_render_info(self):
+        """Process the render info, after it has been (re)obtained."""
+        pass
 
     def update_wgpu_data(self, wobject, environment, shared, env_hash, changed):
         """Update the actual wgpu objects."""
 
+        if self._pipelines_invalid:
+            self._pipelines_invalid = False
+            self.wgpu_pipelines = {}
+
         if self.wgpu_shaders.get(env_hash, None) is None:
             environment.register_pipeline_container(self)  # allows us to clean up
             changed.add("compile_shader")
             self.wgpu_shaders[env_hash] = self._compile_shaders(
                 shared.device, environment.blender
             )
+            # The pipelines for this env use the old shader modules
+            self.wgpu_pipelines.pop(env_hash, None)
 
         if self.wgpu_pipelines.get(env_hash, None) is None:
             changed.add("compose_pipeline")
@@ -340,42 +489,35 @@ class PipelineContainer:
 
     def update_shader_hash(self):
         """Update the shader hash, invalidating the wgpu shaders if it changed."""
-        if self.shader.hash() != self.shader_hash:
-            self.shader_hash = self.shader.hash()
+        # The shader hash does not depend on the environment, so all envs
+        # must be invalidated. Shader modules for equal wgsl are re-used
+        # from the cache, but the wgsl must be generated to know that.
+        shader_hash = self.shader.hash()
+        if shader_hash != self.shader_hash:
+            self.shader_hash = shader_hash
             self.wgpu_shaders = {}
 
     def update_bind_groups(self, device):
         """
         - Calculate new bind_group_layout_descriptors (simple dicts).
-        - When this has changed from our last version, we also update
+        - When the layout has changed from our last version, we also update
           wgpu_bind_group_layouts and reset self.wgpu_pipelines
-        - Calculate new wgpu_bind_groups.
+        - Calculate new wgpu_bind_groups, if the layouts or the native
+          resources have changed.
         """
-        binding_groups = self.resources["bindings"]
-
-        # Check the bindings structure
-        for i, group in binding_groups.items():
-            assert isinstance(i, int)
-            assert isinstance(group, dict)
-            for j, b in group.items():
-                assert isinstance(j, int)
-                assert isinstance(b, Binding)
-
         # Create two new dicts that correspond closely to the bindings
         # in the resources. Except this turns the dicts into lists.
         # These are the descriptors to create the wgpu bind groups and
         # bind group layouts.
         bg_descriptors = []
         bg_layout_descriptors = []
-        for group_id in sorted(binding_groups.keys()):
-            bindings_dict = binding_groups[group_id]
+        for group_id, bindings in self._sorted_bindings:
             while len(bg_descriptors) <= group_id:
                 bg_descriptors.append([])
                 bg_layout_descriptors.append([])
             bg_descriptor = bg_descriptors[group_id]
             bg_layout_descriptor = bg_layout_descriptors[group_id]
-            for slot in sorted(bindings_dict.keys()):
-                binding = bindings_dict[slot]
+            for slot, binding in bindings:
                 binding_des, binding_layout_des = binding.get_bind_group_descriptors(
                     slot
                 )
@@ -387,26 +529,49 @@ class PipelineContainer:
             bg_descriptors.pop(-1)
             bg_layout_descriptors.pop(-1)
 
-        # If the layout has changed, we need a new pipeline
-        if self.bind_group_layout_descriptors != bg_layout_descriptors:
+        # If the layout has changed, we need a new pipeline. Rather than
+        # comparing the descriptors, we compare a key of the properties
+        # that the layout descriptors are derived from.
+        layout_key = tuple(
+            (group_id, tuple((slot, _get_layout_key(b)) for slot, b in bindings))
+            for group_id, bindings in self._sorted_bindings
+        )
+        if layout_key != self._bind_group_layout_key:
+            self._bind_group_layout_key = layout_key
             self.bind_group_layout_descriptors = bg_layout_descriptors
             # Invalidate the pipeline
-            self.wgpu_pipelines = {}
+            self._pipelines_invalid = True
             # Create wgpu objects for the bind group layouts
             self.wgpu_bind_group_layouts = []
             for bg_layout_descriptor in bg_layout_descriptors:
-                bind_group_layout = device.create_bind_group_layout(
-                    entries=bg_layout_descriptor
+                bind_group_layout = cache.get_bind_group_layout(
+                    device, bg_layout_descriptor
                 )
                 self.wgpu_bind_group_layouts.append(bind_group_layout)
 
-        # Always create wgpu objects for the bind groups. Note that this dict
-        # includes the buffer texture objects.
+        # Create wgpu objects for the bind groups, unless they'd be equal
+        # to the current ones, i.e. when the same layouts and native
+        # buffer/texture objects are used. Note that the bind groups
+        # include these objects, and therefore keep them alive.
+        bg_key = tuple(self.wgpu_bind_group_layouts)
+        bg_key += tuple(
+            tuple(_get_bind_group_entry_key(entry) for entry in bg_descriptor)
+            for bg_descriptor in bg_descriptors
+        )
+        if bg_key == self._bind_group_key and self.wgpu_bind_groups:
+            return
+        self._bind_group_key = bg_key
         self.wgpu_bind_groups = []
         for bg_descriptor, layout in zip(bg_descriptors, self.wgpu_bind_group_layouts):
             bind_group = device.create_bind_group(layout=layout, entries=bg_descriptor)
             self.wgpu_bind_groups.append(bind_group)
 
+        # The arguments for set_bind_group() in dispatch() and draw()
+        self._bind_group_args = tuple(
+            (i, bind_group, _no_dynamic_offsets, 0, 0)
+            for i, bind_group in enumerate(self.wgpu_bind_groups)
+        )
+
     def collect_flat_resources(self):
         """Collect a list of all used resources, and also set their usage."""
         resources = self.resources
@@ -461,6 +626,7 @@ class ComputePipelineContainer(PipelineContainer):
 
     # These checks are here to validate the output of the shader
     # methods, not for user code. So its ok to use assertions here.
+    # They are skipped altogether when Python runs with -O.
 
     def _check_pipeline_info(self):
         pipeline_info = self.pipeline_info
@@ -483,23 +649,24 @@ class ComputePipelineContainer(PipelineContainer):
         resources = self.resources
         assert isinstance(resources, dict)
         assert set(resources.keys()) == {"bindings"}, f"{resources.keys()}"
+        self._check_bindings()
 
     def _compile_shaders(self, device, blender):
         """Compile the templateds wgsl shader to a wgpu shader module."""
-        wgsl = self.shader.generate_wgsl()
-        shader_module = cache.get_shader_module(device, wgsl)
+        shader_module = cache.get_shader_module_from_shader(device, self.shader)
         return {0: shader_module}
 
     def _compose_pipelines(self, device, blender, shader_modules):
         """Create the wgpu pipeline object from the shader and bind group layouts."""
 
-        # Create pipeline layout object from list of layouts
-        pipeline_layout = device.create_pipeline_layout(
-            bind_group_layouts=self.wgpu_bind_group_layouts
+        # Get pipeline layout object from list of layouts
+        pipeline_layout = cache.get_pipeline_layout(
+            device, self.wgpu_bind_group_layouts
         )
 
-        # Create pipeline object
-        pipeline = device.create_compute_pipeline(
+        # Get pipeline object
+        pipeline = cache.get_compute_pipeline(
+            device,
             layout=pipeline_layout,
             compute={"module": shader_modules[0], "entry_point": "main"},
         )
@@ -512,19 +679,23 @@ class ComputePipelineContainer(PipelineContainer):
             return
 
         # Collect what's needed
-        pipeline = self.wgpu_pipeline
+        pipeline = self.wgpu_pipelines[0][0]
         indices = self.render_info["indices"]
-        bind_groups = self.wgpu_bind_groups
 
         # Set pipeline and resources
         compute_pass.set_pipeline(pipeline)
-        for bind_group_id, bind_group in enumerate(bind_groups):
-            compute_pass.set_bind_group(bind_group_id, bind_group, [], 0, 999999)
+        for args in self._bind_group_args:
+            compute_pass.set_bind_group(*args)
 
         # Compute!
         compute_pass.dispatch_workgroups(*indices)
 
 
+def _get_index_format(index_buffer):
+    index_format = to_vertex_format(index_buffer.format)
+    return index_format.split("x")[0].replace("s", "u")
+
+
 class RenderPipelineContainer(PipelineContainer):
     """Container for render pipelines."""
 
@@ -532,6 +703,10 @@ class RenderPipelineContainer(PipelineContainer):
         super().__init__(shader)
         self.strip_index_format = 0
         self.vertex_buffer_descriptors = []
+        self._vertex_buffer_key = ()
+        self._vertex_buffer_args = ()
+        self._index_buffer_args = None
+        self._draw_args = ()
 
     def _check_pipeline_info(self):
         pipeline_info = self.pipeline_info
@@ -540,8 +715,6 @@ class RenderPipelineContainer(PipelineContainer):
         expected = {"cull_mode", "primitive_topology"}
         assert set(pipeline_info.keys()) == expected, f"{pipeline_info.keys()}"
 
-        self.update_index_buffer_format()
-
     def _check_render_info(self):
         render_info = self.render_info
         assert isinstance(render_info, dict)
@@ -553,8 +726,6 @@ class RenderPipelineContainer(PipelineContainer):
         assert isinstance(indices, (tuple, list))
         assert all(isinstance(i, int) for i in indices)
         assert len(indices) in (2, 4, 5)
-        if len(indices) == 2:
-            render_info["indices"] = indices[0], indices[1], 0, 0
 
         render_mask = render_info["render_mask"]
         assert isinstance(render_mask, int) and render_mask in (1, 2, 3)
@@ -570,9 +741,50 @@ class RenderPipelineContainer(PipelineContainer):
         assert isinstance(resources["vertex_buffers"], dict)
         assert all(isinstance(slot, int) for slot in resources["vertex_buffers"].keys())
         assert all(isinstance(b, Buffer) for b in resources["vertex_buffers"].values())
+        self._check_bindings()
 
+    def _process_resources(self):
+        super()._process_resources()
         self.update_index_buffer_format()
         self.update_vertex_buffer_descriptors()
+        # The wgpu buffer of a Buffer does not change once it's created,
+        # but the vertex_byte_range can be changed at any time.
+        self._vertex_buffer_args = tuple(
+            (slot, vbuffer, vbuffer._wgpu_buffer[1])
+            for slot, vbuffer in self.resources["vertex_buffers"].items()
+        )
+        self.update_draw_args()
+
+    def _process_pipeline_info(self):
+        self.update_index_buffer_format()
+
+    def _process_render_info(self):
+        indices = self.render_info["indices"]
+        if len(indices) == 2:
+            self.render_info["indices"] = indices[0], indices[1], 0, 0
+        self.update_draw_args()
+
+    def update_draw_args(self):
+        """Prepare the arguments for the draw call, so that draw() does
+        not have to compose these for each draw.
+        """
+        if not self.resources or not self.render_info:
+            return
+        indices = tuple(self.render_info["indices"])
+        index_buffer = self.resources["index_buffer"]
+        if index_buffer is None:
+            self._index_buffer_args = None
+            self._draw_args = indices
+        else:
+            index_format = _get_index_format(index_buffer)
+            wgpu_buffer = index_buffer._wgpu_buffer[1]
+            self._index_buffer_args = wgpu_buffer, index_format, 0, index_buffer.nbytes
+            # draw_indexed() has a base_vertex arg, a value added to each
+            # index before reading from the vertex buffers.
+            if len(indices) == 4:
+                base_vertex = 0
+                indices = indices[:3] + (base_vertex,) + indices[3:]
+            self._draw_args = indices
 
     def update_index_buffer_format(self):
         if not self.resources or not self.pipeline_info:
@@ -581,36 +793,42 @@ class RenderPipelineContainer(PipelineContainer):
         index_format = wgpu.IndexFormat.uint32
         index_buffer = self.resources["index_buffer"]
         if index_buffer is not None:
-            index_format = to_vertex_format(index_buffer.format)
-            index_format = index_format.split("x")[0].replace("s", "u")
+            index_format = _get_index_format(index_buffer)
         strip_index_format = 0
         if "strip" in self.pipeline_info["primitive_topology"]:
             strip_index_format = index_format
         # Trigger a pipeline rebuild?
         if self.strip_index_format != strip_index_format:
             self.strip_index_format = strip_index_format
-            self.wgpu_pipelines = {}
+            self._pipelines_invalid = True
 
     def update_vertex_buffer_descriptors(self):
         # todo: we can probably expose multiple attributes per buffer using a BufferView
+        # The descriptors are fully defined by this key
+        vertex_buffer_key = tuple(
+            (slot, buffer.nbytes // buffer.nitems, buffer.format)
+            for slot, buffer in self.resources["vertex_buffers"].items()
+        )
+        if vertex_buffer_key == self._vertex_buffer_key:
+            return
         vertex_buffer_descriptors = []
-        for slot, buffer in self.resources["vertex_buffers"].items():
+        for slot, stride, format in vertex_buffer_key:
             vbo_des = {
-                "array_stride": buffer.nbytes // buffer.nitems,
+                "array_stride": stride,
                 "step_mode": wgpu.VertexStepMode.vertex,  # vertex or instance
                 "attributes": [
                     {
-                        "format": to_vertex_format(buffer.format),
+                        "format": to_vertex_format(format),
                         "offset": 0,
                         "shader_location": slot,
                     }
                 ],
             }
             vertex_buffer_descriptors.append(vbo_des)
-        # Trigger a pipeline rebuild?
-        if vertex_buffer_descriptors != self.vertex_buffer_descriptors:
-            self.vertex_buffer_descriptors = vertex_buffer_descriptors
-            self.wgpu_pipelines = {}
+        # Trigger a pipeline rebuild
+        self._vertex_buffer_key = vertex_buffer_key
+        self.vertex_buffer_descriptors = vertex_buffer_descriptors
+        self._pipelines_invalid = True
 
     def _compile_shaders(self, device, blender):
         """Compile the templated shader to a list of wgpu shader modules
@@ -622,8 +840,10 @@ class RenderPipelineContainer(PipelineContainer):
             if not color_descriptors:
                 continue
 
-            wgsl = self.shader.generate_wgsl(**blender.get_shader_kwargs(pass_index))
-            shader_modules[pass_index] = cache.get_shader_module(device, wgsl)
+            shader_kwargs = blender.get_shader_kwargs(pass_index)
+            shader_modules[pass_index] = cache.get_shader_module_from_shader(
+                device, self.shader, **shader_kwargs
+            )
 
         return shader_modules
 
@@ -632,17 +852,14 @@ class RenderPipelineContainer(PipelineContainer):
         layouts and other pipeline info (one for each pass of the blender).
         """
 
-        # todo: cache the pipeline with a lot of things as the hash
-        # todo: cache vertex descriptors
-
         strip_index_format = self.strip_index_format
         vertex_buffer_descriptors = self.vertex_buffer_descriptors
         primitive_topology = self.pipeline_info["primitive_topology"]
         cull_mode = self.pipeline_info["cull_mode"]
 
-        # Create pipeline layout object from list of layouts
-        pipeline_layout = device.create_pipeline_layout(
-            bind_group_layouts=self.wgpu_bind_group_layouts
+        # Get pipeline layout object from list of layouts
+        pipeline_layout = cache.get_pipeline_layout(
+            device, self.wgpu_bind_group_layouts
         )
 
         # Instantiate the pipeline objects
@@ -655,7 +872,8 @@ class RenderPipelineContainer(PipelineContainer):
 
             shader_module = shader_modules[pass_index]
 
-            pipelines[pass_index] = device.create_render_pipeline(
+            pipelines[pass_index] = cache.get_render_pipeline(
+                device,
                 layout=pipeline_layout,
                 vertex={
                     "module": shader_module,
@@ -694,65 +912,138 @@ class RenderPipelineContainer(PipelineContainer):
 
         if not (render_mask & self.render_info["render_mask"]):
             return
-        env_hash = environment.hash
+        env_hash = id(environment)
 
         # Collect what's needed
         pipeline = self.wgpu_pipelines[env_hash][pass_index]
-        indices = self.render_info["indices"]
-        index_buffer = self.resources["index_buffer"]
-        vertex_buffers = self.resources["vertex_buffers"]
-        bind_groups = self.wgpu_bind_groups
 
         # Set pipeline and resources
         render_pass.set_pipeline(pipeline)
-        for slot, vbuffer in vertex_buffers.items():
-            render_pass.set_vertex_buffer(
-                slot,
-                vbuffer._wgpu_buffer[1],
-                vbuffer.vertex_byte_range[0],
-                vbuffer.vertex_byte_range[1],
-            )
-        for bind_group_id, bind_group in enumerate(bind_groups):
-            render_pass.set_bind_group(bind_group_id, bind_group, [], 0, 99)
+        for slot, vbuffer, wgpu_buffer in self._vertex_buffer_args:
+            offset, size = vbuffer.vertex_byte_range
+            render_pass.set_vertex_buffer(slot, wgpu_buffer, offset, size)
+        for args in self._bind_group_args:
+            render_pass.set_bind_group(*args)
 
         # Draw!
         # draw_indexed(count_v, count_i, first_vertex, base_vertex, first_instance)
         # draw(count_vertex, count_instance, first_vertex, first_instance)
-        if index_buffer is not None:
-            render_pass.set_index_buffer(index_buffer, 0, index_buffer.size)
-            if len(indices) == 4:
-                base_vertex = 0  # A value added to each index before reading [...]
-                indices = list(indices)
-                indices.insert(-1, base_vertex)
-            render_pass.draw_indexed(*indices)
+        if self._index_buffer_args is None:
+            render_pass.draw(*self._draw_args)
         else:
-            render_pass.draw(*indices)
+            render_pass.set_index_buffer(*self._index_buffer_args)
+            render_pass.draw_indexed(*self._draw_args)
 
 
 class Cache:
-    def __init__(self):
-        self._d = {}
+    """A cache for wgpu objects, which allows objects that use the
+    same shader (and state) to share the native objects. Objects that
+    are specific to a world object, like bind groups, are not cached here,
+    because these (indirectly) reference its buffers and textures.
+
+    The objects are stored via weak references, so they are released when
+    no longer used (e.g. by a pipeline container or another cached object).
+    The most recently used objects are kept alive, so that e.g. removing and
+    adding an object does not require re-creating its pipeline.
+    """
+
+    def __init__(self, hot_size=128):
+        self._d = weakref.WeakValueDictionary()
+        self._hot = collections.OrderedDict()
+        self._hot_size = hot_size
 
     def get(self, key):
-        return self._d.get(key, None)
+        ob = self._d.get(key, None)
+        if ob is not None:
+            self._make_hot(key, ob)
+        return ob
 
     def set(self, key, value):
         self._d[key] = value
+        self._make_hot(key, value)
+
+    def _make_hot(self, key, ob):
+        hot = self._hot
+        hot[key] = ob
+        hot.move_to_end(key)
+        while len(hot) > self._hot_size:
+            hot.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        """Get the object for the given key, or create it by calling
+        the given factory (without arguments) and store it.
+        """
+        ob = self.get(key)
+        if ob is None:
+            ob = factory()
+            self.set(key, ob)
+        return ob
 
     def get_shader_module(self, device, source):
         """Compile a shader module object, or re-use it from the cache."""
-        # todo: also release shader modules that are no longer used
-        # todo: cache more objects, like pipelines once we figure out how to clean things up
-
         assert isinstance(source, str)
-        key = source  # or hash(code)
+        # Use a digest, so that the (long) source is not stored as a key
+        key = "shader_module", hashlib.sha1(source.encode()).hexdigest()
+        return self.get_or_create(key, lambda: device.create_shader_module(code=source))
+
+    def get_shader_module_from_shader(self, device, shader, **kwargs):
+        """Get a shader module for the given shader object and extra
+        templating variables. The wgsl is a function of the shader's class,
+        its hash and the kwargs, so if these match, the module is re-used
+        without generating the wgsl (which is relatively expensive).
+        """
+        key = "shader_state", shader.__class__, shader.hash(), _freeze(kwargs)
+        return self.get_or_create(
+            key,
+            lambda: self.get_shader_module(device, shader.generate_wgsl(**kwargs)),
+        )
 
-        m = self.get(key)
-        if m is None:
-            m = device.create_shader_module(code=source)
-            self.set(key, m)
+    def get_bind_group_layout(self, device, entries):
+        """Create a bind group layout object, or re-use it from the cache.
+        Objects that use the same shader typically have equal layouts.
+        """
+        key = "bind_group_layout", _freeze(entries)
+        return self.get_or_create(
+            key, lambda: device.create_bind_group_layout(entries=entries)
+        )
 
-        return m
+    def get_pipeline_layout(self, device, bind_group_layouts):
+        """Create a pipeline layout object, or re-use it from the cache."""
+        # The key holds the bind group layouts, keeping them alive
+        key = "pipeline_layout", tuple(bind_group_layouts)
+        return self.get_or_create(
+            key,
+            lambda: device.create_pipeline_layout(
+                bind_group_layouts=bind_group_layouts
+            ),
+        )
+
+    def get_render_pipeline(self, device, **descriptor):
+        """Create a render pipeline object, or re-use it from the cache.
+        Objects that use the same shader and pipeline state can share it.
+        """
+        # The key includes the (cached) shader module and pipeline layout
+        key = "render_pipeline", _freeze(descriptor)
+        return self.get_or_create(
+            key, lambda: device.create_render_pipeline(**descriptor)
+        )
+
+    def get_compute_pipeline(self, device, **descriptor):
+        """Create a compute pipeline object, or re-use it from the cache."""
+        key = "compute_pipeline", _freeze(descriptor)
+        return self.get_or_create(
+            key, lambda: device.create_compute_pipeline(**descriptor)
+        )
+
+
+def _freeze(ob):
+    """Turn a (nested) descriptor into a hashable object."""
+    if isinstance(ob, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in ob.items()))
+    elif isinstance(ob, (list, tuple)):
+        return tuple(_freeze(v) for v in ob)
+    else:
+        return ob
 
 
 cache = Cache()
@@ -343,6 +343,22 @@ class WgpuRenderer(RootEventHandler, Renderer):
             self.blend_mode, weakref.WeakKeyDictionary()
         )
 
+    def compile(self, scene: WorldObject):
+        """Prepare the GPU objects for all world objects in the given
+        scene, compiling their shaders and creating their pipelines.
+
+        This is done automatically in ``render()``, but calling this in
+        advance (e.g. after setting up a scene) means that the first
+        render does not have to wait for shader compilation. Only objects
+        that are new, or have changed, are updated.
+        """
+        environment = get_environment(self, scene)
+        wobject_list = []
+        scene.traverse(wobject_list.append, True)
+        for wobject in wobject_list:
+            if wobject.material:
+                get_pipeline_container_group(wobject, environment, self._shared)
+
     def render(
         self,
         scene: WorldObject,
@@ -466,6 +482,11 @@ class WgpuRenderer(RootEventHandler, Renderer):
         # look into render bundles. See https://github.com/gfx-rs/wgpu-native/issues/154
         # If we do get this to work, we should trigger a new recording
         # when the wobject's children, visibile, render_order, or render_pass changes.
+        # Note that the shaders' get_resources(), get_pipeline_info() and
+        # get_render_info() are not called here for static objects; the
+        # pipeline containers only call them when tracked attributes change.
+        # The wgpu version we use does not implement render bundles yet
+        # (create_render_bundle_encoder() and execute_bundles() raise).
 
         # Record the rendering of all world objects, or re-use previous recording
         command_buffers = []
@@ -580,9 +601,19 @@ class WgpuRenderer(RootEventHandler, Renderer):
         stdinfo_data[
             "projection_transform_inv"
         ].flat = camera.projection_matrix_inverse.elements
-        # stdinfo_data["ndc_to_world"].flat = np.linalg.inv(stdinfo_data["cam_transform"] @ stdinfo_data["projection_transform"])
+        stdinfo_data["projection_cam_transform"].flat = (
+            Matrix4()
+            .multiply_matrices(camera.projection_matrix, camera.matrix_world_inverse)
+            .elements
+        )
+        stdinfo_data["projection_cam_transform_inv"].flat = (
+            Matrix4()
+            .multiply_matrices(camera.matrix_world, camera.projection_matrix_inverse)
+            .elements
+        )
         stdinfo_data["physical_size"] = physical_size
         stdinfo_data["logical_size"] = logical_size
+        stdinfo_data["inv_half_logical_size"] = [2.0 / x for x in logical_size]
         stdinfo_data["flipped_winding"] = camera.flips_winding
         # Upload to GPU
         self._shared.uniform_buffer.update_range(0, 1)
@@ -1,8 +1,72 @@
+from functools import lru_cache
+
 from ...resources import Buffer, Texture, TextureView
 from ._utils import to_vertex_format, to_texture_format
 from ._shaderbase import BaseShader
 
 
+@lru_cache(maxsize=None)
+def _get_colormap_meta(format):
+    """Get the sample type and number of channels for a colormap texture
+    format. The result is cached, since there are only few formats.
+    """
+    fmt = to_texture_format(format)
+    if "norm" in fmt or "float" in fmt:
+        sample_type = "f32"
+    elif "uint" in fmt:
+        sample_type = "u32"
+    else:
+        sample_type = "i32"
+    nchannels = len(fmt) - len(fmt.lstrip("rgba"))
+    return sample_type, nchannels
+
+
+def _pick_pack(*fields):
+    """Template function to pack multiple values into a rgba16uint (64
+    bits available). Each field is a tuple (wgsl_expression, bits). Since
+    the bit offsets are known at template time, this produces a
+    straight-line vec4<u32> expression without any runtime shifting
+    logic. Note that we store in a vec4<u32> but this gets written to a
+    4xu16. See #212 for details.
+    """
+    for value, bits in fields:
+        if not 0 < bits <= 32:
+            raise ValueError(f"Cannot pack {bits} bits for {value}, must be 1-32.")
+    total_bits = sum(bits for _, bits in fields)
+    if total_bits > 64:
+        raise ValueError(f"Cannot pack {total_bits} bits of pick info, max is 64.")
+
+    terms = [[], [], [], []]
+    needs_mask = [False, False, False, False]
+    offset = 0
+    for value, bits in fields:
+        # Clip the given value to the max value that fits in the bits
+        value = f"min({value}, {(1 << bits) - 1}u)"
+        # Shift into each component that the bits overlap with
+        for i in range(4):
+            shift = offset - 16 * i
+            if shift >= 16 or shift <= -bits:
+                continue
+            elif shift > 0:
+                terms[i].append(f"({value} << {shift}u)")
+            elif shift < 0:
+                terms[i].append(f"({value} >> {-shift}u)")
+            else:
+                terms[i].append(value)
+            needs_mask[i] = needs_mask[i] or shift + bits > 16
+        offset += bits
+    # Combine and mask the components
+    components = []
+    for i in range(4):
+        if not terms[i]:
+            components.append("0u")
+        elif needs_mask[i]:
+            components.append(f"({' | '.join(terms[i])}) & 65535u")
+        else:
+            components.append(" | ".join(terms[i]))
+    return "vec4<u32>(\n    " + ",\n    ".join(components) + "\n)"
+
+
 class WorldObjectShader(BaseShader):
     """A base shader for world objects. Must be subclassed to implement
     a shader for a specific material. This class also implements common
@@ -11,21 +75,30 @@ class WorldObjectShader(BaseShader):
 
     type = "render"  # must be "compute" or "render"
 
-    def __init__(self, wobject, **kwargs):
-        super().__init__(**kwargs)
+    # Cache for code_common(), shared by all subclasses
+    _code_common_cache = {}
 
-        # Init values that get set when generate_wgsl() is called, using blender.get_shader_kwargs()
-        self.kwargs.setdefault("write_pick", True)
-        self.kwargs.setdefault("blending_code", "")
+    # Default templating variables. The first two get set when
+    # generate_wgsl() is called, using blender.get_shader_kwargs().
+    _default_kwargs = {
+        "write_pick": True,
+        "blending_code": "",
+        "colormap_dim": "",
+        "colormap_coord_type": "f32",
+        "colormap_nchannels": 1,
+        "colormap_format": "f32",
+    }
 
-        # Init colormap values
-        self.kwargs.setdefault("colormap_dim", "")
-        self.kwargs.setdefault("colormap_nchannels", 1)
-        self.kwargs.setdefault("colormap_format", "f32")
+    def __init__(self, wobject, **kwargs):
+        super().__init__(**{**self._default_kwargs, **kwargs})
 
         # Apply_clip_planes
         self["n_clipping_planes"] = len(wobject.material.clipping_planes)
-        self["clipping_mode"] = wobject.material.clipping_mode
+
+    def generate_wgsl(self, **kwargs):
+        # Make the pick_pack() template function available. It's not part of
+        # the kwargs (nor the hash), because it's the same for all shaders.
+        return super().generate_wgsl(pick_pack=_pick_pack, **kwargs)
 
     # ----- What subclasses must implement
 
@@ -88,42 +161,9 @@ class WorldObjectShader(BaseShader):
         In the WGSL the colormap can be sampled using ``sample_colormap()``.
         Returns a list of bindings.
         """
-        from ._pipeline import Binding  # avoid recursive import
-
-        if isinstance(texture_view, Texture):
-            raise TypeError("texture_view is a Texture, but must be a TextureView")
-        elif not isinstance(texture_view, TextureView):
-            raise TypeError("texture_view must be a TextureView")
-        elif not isinstance(texcoords, Buffer):
+        if not isinstance(texcoords, Buffer):
             raise ValueError("texture_view is present, but texcoords must be a buffer")
-        # Dimensionality
-        self["colormap_dim"] = view_dim = texture_view.view_dim
-        if view_dim not in ("1d", "2d", "3d"):
-            raise ValueError("Unexpected texture dimension")
-        # Texture dim matches texcoords
-        vert_fmt = to_vertex_format(texcoords.format)
-        if view_dim == "1d" and "x" not in vert_fmt:
-            pass
-        elif not vert_fmt.endswith("x" + view_dim[0]):
-            raise ValueError(
-                f"texcoords {texcoords.format} does not match texture_view {view_dim}"
-            )
-        # Sampling type
-        fmt = to_texture_format(texture_view.format)
-        if "norm" in fmt or "float" in fmt:
-            self["colormap_format"] = "f32"
-        elif "uint" in fmt:
-            self["colormap_format"] = "u32"
-        else:
-            self["colormap_format"] = "i32"
-        # Channels
-        self["colormap_nchannels"] = len(fmt) - len(fmt.lstrip("rgba"))
-        # Return bindings
-        return [
-            Binding("s_colormap", "sampler/filtering", texture_view, "FRAGMENT"),
-            Binding("t_colormap", "texture/auto", texture_view, "FRAGMENT"),
-            Binding("s_texcoords", "buffer/read_only_storage", texcoords, "VERTEX"),
-        ]
+        return self._define_colormap(texture_view, texcoords)
 
     def define_img_colormap(self, texture_view):
         """Define the given texture view as the colormap to be used to
@@ -131,6 +171,9 @@ class WorldObjectShader(BaseShader):
         In the WGSL the colormap can be sampled using ``sample_colormap()``.
         Returns a list of bindings.
         """
+        return self._define_colormap(texture_view)
+
+    def _define_colormap(self, texture_view, texcoords=None):
         from ._pipeline import Binding  # avoid recursive import
 
         if isinstance(texture_view, Texture):
@@ -139,33 +182,39 @@ class WorldObjectShader(BaseShader):
             raise TypeError("texture_view must be a TextureView")
         # Dimensionality
         self["colormap_dim"] = view_dim = texture_view.view_dim
-        if texture_view.view_dim not in ("1d", "2d", "3d"):
+        if view_dim not in ("1d", "2d", "3d"):
             raise ValueError("Unexpected colormap texture dimension")
-        # Texture dim matches image channels
-        if int(view_dim[0]) != self["img_nchannels"]:
+        typemap = {"1d": "f32", "2d": "vec2<f32>", "3d": "vec3<f32>"}
+        self["colormap_coord_type"] = typemap[view_dim]
+        if texcoords is not None:
+            # Texture dim matches texcoords
+            vert_fmt = to_vertex_format(texcoords.format)
+            if view_dim == "1d" and "x" not in vert_fmt:
+                pass
+            elif not vert_fmt.endswith("x" + view_dim[0]):
+                raise ValueError(
+                    f"texcoords {texcoords.format} does not match texture_view {view_dim}"
+                )
+        elif int(view_dim[0]) != self["img_nchannels"]:
+            # Texture dim matches image channels
             raise ValueError(
                 f"Image channels {self['img_nchannels']} does not match texture_view {view_dim}"
             )
-        # Sampling type
-        fmt = to_texture_format(texture_view.format)
-        if "norm" in fmt or "float" in fmt:
-            self["colormap_format"] = "f32"
-        elif "uint" in fmt:
-            self["colormap_format"] = "u32"
-        else:
-            self["colormap_format"] = "i32"
-        # Channels
-        self["colormap_nchannels"] = len(fmt) - len(fmt.lstrip("rgba"))
+        # Sampling type and channels
+        meta = _get_colormap_meta(texture_view.format)
+        self["colormap_format"], self["colormap_nchannels"] = meta
         # Return bindings
-        return [
+        bindings = [
             Binding("s_colormap", "sampler/filtering", texture_view, "FRAGMENT"),
             Binding("t_colormap", "texture/auto", texture_view, "FRAGMENT"),
         ]
+        if texcoords is not None:
+            bindings.append(
+                Binding("s_texcoords", "buffer/read_only_storage", texcoords, "VERTEX")
+            )
+        return bindings
 
     def _code_colormap(self):
-        typemap = {"1d": "f32", "2d": "vec2<f32>", "3d": "vec3<f32>"}
-        self["colormap_coord_type"] = typemap.get(self["colormap_dim"], "f32")
-
         return """
         fn sample_colormap(texcoord: {{ colormap_coord_type }}) -> vec4<f32> {
             // Sample in the colormap. We get a vec4 color, but not all channels may be used.
@@ -213,8 +262,18 @@ class WorldObjectShader(BaseShader):
     # ----- WGSL lib
 
     def code_common(self):
-        """Get the WGSL functions builtin by PyGfx."""
+        """Get the WGSL functions builtin by PyGfx.
+
+        The (still templated) result only depends on the class and the
+        number of clipping planes, so it's cached.
+        """
+        key = self.__class__, self["n_clipping_planes"]
+        code = self._code_common_cache.get(key)
+        if code is None:
+            code = self._code_common_cache[key] = self._compose_code_common()
+        return code
 
+    def _compose_code_common(self):
         # Just a placeholder
         blending_code = """
         let alpha_compare_epsilon : f32 = 1e-6;
@@ -225,7 +284,6 @@ class WorldObjectShader(BaseShader):
             self._code_colormap()
             + self._code_lighting()
             + self._code_clipping_planes()
-            + self._code_picking()
             + self._code_misc()
             + blending_code
         )
@@ -237,47 +295,26 @@ class WorldObjectShader(BaseShader):
             fn apply_clipping_planes(world_pos: vec3<f32>) { }
             """
 
-        return """
-        fn check_clipping_planes(world_pos: vec3<f32>) -> bool {
-            var clipped: bool = {{ 'false' if clipping_mode == 'ANY' else 'true' }};
-            for (var i=0; i<{{ n_clipping_planes }}; i=i+1) {
+        # The clipping mode is a uniform, so the mode does not produce
+        # different shaders. The loop is cheap enough to do both reductions.
+        # The number of planes is known here, so we use an f-string rather
+        # than leaving a templating variable for jinja to resolve.
+        n = self["n_clipping_planes"]
+        return f"""
+        fn check_clipping_planes(world_pos: vec3<f32>) -> bool {{
+            var clipped_any: bool = false;
+            var clipped_all: bool = true;
+            for (var i=0; i<{n}; i=i+1) {{
                 let plane = u_material.clipping_planes[i];
                 let plane_clipped = dot( world_pos, plane.xyz ) < plane.w;
-                clipped = clipped {{ '||' if clipping_mode == 'ANY' else '&&' }} plane_clipped;
-            }
-            return !clipped;
-        }
-        fn apply_clipping_planes(world_pos: vec3<f32>) {
-            if (!(check_clipping_planes(world_pos))) { discard; }
-        }
-        """
-
-    def _code_picking(self):
-        return """
-        var<private> p_pick_bits_used : i32 = 0;
-
-        fn pick_pack(value: u32, bits: i32) -> vec4<u32> {
-            // Utility to pack multiple values into a rgba16uint (64 bits available).
-            // Note that we store in a vec4<u32> but this gets written to a 4xu16.
-            // See #212 for details.
-            //
-            // Clip the given value
-            let v = min(value, u32(exp2(f32(bits))));
-            // Determine bit-shift for each component
-            let shift = vec4<i32>(
-                p_pick_bits_used, p_pick_bits_used - 16, p_pick_bits_used - 32, p_pick_bits_used - 48,
-            );
-            // Prepare for next pack
-            p_pick_bits_used = p_pick_bits_used + bits;
-            // Apply the shift for each component
-            let vv = vec4<u32>(v);
-            let selector1 = vec4<bool>(shift[0] < 0, shift[1] < 0, shift[2] < 0, shift[3] < 0);
-            let pick_new = select( vv << vec4<u32>(shift) , vv >> vec4<u32>(-shift) , selector1 );
-            // Mask the components
-            let mask = vec4<u32>(65535u);
-            let selector2 = vec4<bool>( abs(shift[0]) < 32, abs(shift[1]) < 32, abs(shift[2]) < 32, abs(shift[3]) < 32 );
-            return select( vec4<u32>(0u) , pick_new & mask , selector2 );
-        }
+                clipped_any = clipped_any || plane_clipped;
+                clipped_all = clipped_all && plane_clipped;
+            }}
+            return !select(clipped_any, clipped_all, u_material.clipping_mode == 1u);
+        }}
+        fn apply_clipping_planes(world_pos: vec3<f32>) {{
+            if (!(check_clipping_planes(world_pos))) {{ discard; }}
+        }}
         """
 
     def _code_lighting(self):
@@ -289,8 +326,7 @@ class WorldObjectShader(BaseShader):
         return """
 
         fn ndc_to_world_pos(ndc_pos: vec4<f32>) -> vec3<f32> {
-            let ndc_to_world = u_stdinfo.cam_transform_inv * u_stdinfo.projection_transform_inv;
-            let world_pos = ndc_to_world * ndc_pos;
+            let world_pos = u_stdinfo.projection_cam_transform_inv * ndc_pos;
             return world_pos.xyz / world_pos.w;
         }
 
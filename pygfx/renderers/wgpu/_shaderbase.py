@@ -6,7 +6,9 @@ pipeline and rendering.
 """
 
 import re
+import sys
 import hashlib
+from functools import lru_cache
 
 import jinja2
 import numpy as np
@@ -26,8 +28,61 @@ jinja_env = jinja2.Environment(
 )
 
 
+@lru_cache(maxsize=256)
+def get_template(code):
+    """Get a compiled jinja template for the given code. Compiling a
+    template is relatively expensive, and the code for a shader class is
+    often the same for many objects, so the templates are cached.
+    """
+    return jinja_env.from_string(code)
+
+
+def render_wgsl(code, kwargs):
+    """Render the given templated code, and resolve the varyings and
+    depth output.
+    """
+    t = get_template(code)
+
+    err_msg = None
+    try:
+        code2 = t.render(**kwargs)
+    except jinja2.UndefinedError as err:
+        err_msg = f"Canot compose shader: {err.args[0]}"
+
+    if err_msg:
+        # Don't raise within handler to avoid recursive tb
+        raise ValueError(err_msg)
+
+    # Only resolve when needed; the resolvers process the code line-by-line
+    if "aryings" in code2:
+        code2 = resolve_varyings(code2)
+    if "out.depth" in code2:
+        code2 = resolve_depth_output(code2)
+    return code2
+
+
+_render_cache = {}
+_render_cache_maxsize = 256
+
+
+def _render_wgsl_cached(code, kwargs_key):
+    # Use a digest, so that the (long) source is not stored as a key.
+    # The template itself is cached separately by get_template().
+    key = hashlib.sha1(code.encode()).hexdigest(), kwargs_key
+    try:
+        return _render_cache[key]
+    except KeyError:
+        pass
+    result = render_wgsl(code, {k: v for k, _, v in kwargs_key})
+    if len(_render_cache) >= _render_cache_maxsize:
+        # Drop the oldest entry (dicts are ordered)
+        _render_cache.pop(next(iter(_render_cache)))
+    _render_cache[key] = result
+    return result
+
+
 varying_types = ["f32", "vec2<f32>", "vec3<f32>", "vec4<f32>"]
-varying_types = (
+varying_types = frozenset(
     varying_types
     + [t.replace("f", "i") for t in varying_types]
     + [t.replace("f", "u") for t in varying_types]
@@ -36,7 +91,9 @@ varying_types = (
 
 re_varying_getter = re.compile(r"[\s,\(\[]varyings\.(\w+)", re.UNICODE)
 re_varying_setter = re.compile(r"\A\s*?varyings\.(\w+)(\.\w+)?\s*?\=")
+re_func_start = re.compile(r"\s*fn\s+(vs_main\b)?")
 builtin_varyings = {"position": "vec4<f32>"}
+unexpected_in_assignment = "fn ", "struct ", "var ", "let ", "}"
 
 
 def resolve_varyings(wgsl):
@@ -64,14 +121,24 @@ def resolve_varyings(wgsl):
     # We try to find the function that first uses the Varyings struct.
     struct_insert_pos = None
 
-    # Go over all lines to:
+    # Bind regexp methods to locals, for the loops below
+    setter_match = re_varying_setter.match
+    getter_finditer = re_varying_getter.finditer
+    func_start_match = re_func_start.match
+
+    # Go over all lines (in a single pass) to:
     # - find the lines where a varying is set
     # - collect the types of these varyings
+    # - collect all used varyings
+    # - find where the vertex-shader starts
+    in_vertex_shader = False
+    current_func_linenr = 0
     for linenr, line in enumerate(lines):
-        match = re_varying_setter.match(line)
+        set_name = None
+        match = setter_match(line)
         if match:
             # Get parts
-            name = match.group(1)
+            set_name = name = match.group(1)
             attr = match.group(2)
             # Handle builtin
             if name in builtin_varyings:
@@ -97,30 +164,23 @@ def resolve_varyings(wgsl):
             # Store position
             assigned_varyings.setdefault(name, []).append(linenr)
 
-    # Go over all lines to:
-    # - collect all used varyings
-    # - find where the vertex-shader starts
-    in_vertex_shader = False
-    current_func_linenr = 0
-    for linenr, line in enumerate(lines):
-        line = line.strip()
         # Detect when we enter a new function
-        if line.startswith("fn "):
+        match = func_start_match(line)
+        if match:
             current_func_linenr = linenr
-            if line.startswith("fn vs_main"):
-                in_vertex_shader = True
-            else:
-                in_vertex_shader = False
+            in_vertex_shader = match.group(1) is not None
+        # Most lines don't mention (V|v)aryings, so we can skip these quickly
+        if "aryings" not in line:
+            continue
         # Remove comments (shader code has no strings that can contain slashes)
-        line = line.split("//")[0]
-        if "Varyings" in line and struct_insert_pos is None:
+        line = line.strip().split("//")[0]
+        if struct_insert_pos is None and "Varyings" in line:
             struct_insert_pos = current_func_linenr
         # Everything we find here is a match (prepend a space to allow an easier regexp)
-        for match in re_varying_getter.finditer(" " + line):
+        for match in getter_finditer(" " + line):
             name = match.group(1)
-            this_varying_is_set_on_this_line = linenr in assigned_varyings.get(name, [])
-            if this_varying_is_set_on_this_line:
-                pass
+            if name == set_name:
+                pass  # This varying is set on this line
             elif in_vertex_shader:
                 # If varyings are used in another way than setting, in the vertex shader,
                 # we should either consider them "used", or possibly break the shader if
@@ -149,8 +209,10 @@ def resolve_varyings(wgsl):
                 while not line_s.endswith(";"):
                     linenr += 1
                     line_s = lines[linenr].strip()
-                    unexpected = "fn ", "struct ", "var ", "let ", "}"
-                    if line_s.startswith(unexpected) or linenr == len(lines) - 1:
+                    if (
+                        line_s.startswith(unexpected_in_assignment)
+                        or linenr == len(lines) - 1
+                    ):
                         raise TypeError(
                             f"Varying {name!r} assignment seems to be missing a semicolon:\n{line}"
                         )
@@ -212,10 +274,11 @@ def resolve_depth_output(wgsl):
     # depth to be known.
     depth_is_set = False
     struct_linrnr = -1
+    depth_setter_match = re_depth_setter.match
     for linenr, line in enumerate(lines):
         if line.lstrip().startswith("struct FragmentOutput {"):
             struct_linrnr = linenr
-        elif re_depth_setter.match(line):
+        elif depth_setter_match(line):
             depth_is_set = True
             if struct_linrnr >= 0:
                 break
@@ -231,6 +294,89 @@ def resolve_depth_output(wgsl):
     return "\n".join(lines)
 
 
+@lru_cache(maxsize=None)
+def _get_storage_element_types(format):
+    """Get the number of channels, the array element type, and the
+    accessor result type for a storage buffer with the given format.
+    Cached, since there are only few formats.
+    """
+    # Get format, and split in the scalar part and the number of channels
+    fmt = to_vertex_format(format)
+    if "x" in fmt:
+        fmt_scalar, _, nchannels = fmt.partition("x")
+        nchannels = int(nchannels)
+    else:
+        fmt_scalar = fmt
+        nchannels = 1
+
+    # Define scalar type: i32, u32 or f32
+    # Since the stride must be a multiple of 4 for storage buffers,
+    # the supported types is limited until we support structured numpy arrays.
+    scalar_type = (
+        fmt_scalar.replace("float", "f").replace("uint", "u").replace("sint", "i")
+    )
+    if not scalar_type.endswith("32"):
+        raise ValueError(
+            f"Buffer format {format} not supported, format must have a stride of 4 bytes: i4, u4 of f4."
+        )
+
+    # Define the element types. The element_type2 is the actual type.
+    # Because for storage buffers a vec3 has an alignment of 16, we have to
+    # be creative for vec3: we bind the buffer as if it was 1D, and convert
+    # in the accessor function.
+    if nchannels == 1:
+        element_type1 = element_type2 = scalar_type
+        stride = 4
+    elif nchannels == 3:
+        element_type1 = scalar_type
+        element_type2 = f"vec{nchannels}<{scalar_type}>"
+        stride = 4
+    else:
+        element_type1 = element_type2 = f"vec{nchannels}<{scalar_type}>"
+        stride = 4 * nchannels
+
+    stride  # not actually used anymore in wgsl?
+
+    return nchannels, element_type1, element_type2
+
+
+@lru_cache(maxsize=None)
+def _get_shadertype_dtype(shadertype_items):
+    """Get the structured dtype for a shadertype, given as a tuple of
+    items. The order of the items matters, so a tuple is used rather than
+    a frozenset.
+    """
+    return array_from_shadertype(dict(shadertype_items)).dtype
+
+
+def _get_struct_dtype_from_shadertype(resource):
+    return _get_shadertype_dtype(tuple(resource.items()))
+
+
+def _get_struct_dtype_from_buffer(resource):
+    if resource.data.dtype.fields is None:
+        raise TypeError(f"define_uniform() needs a structured dtype")
+    return resource.data.dtype
+
+
+def _get_struct_dtype_from_dtype(resource):
+    if resource.fields is None:
+        raise TypeError(f"define_uniform() needs a structured dtype")
+    return resource
+
+
+# The alignment (in bytes) of a 32-bit scalar or vector, by number of elements
+_alignments = (None, 4, 8, 16, 16)
+
+
+# Map resource type to a function to get its struct dtype
+_struct_dtype_funcs = {
+    dict: _get_struct_dtype_from_shadertype,
+    Buffer: _get_struct_dtype_from_buffer,
+    np.dtype: _get_struct_dtype_from_dtype,
+}
+
+
 class BaseShader:
     """Base shader object to compose and template shaders using jinja2.
 
@@ -248,35 +394,55 @@ class BaseShader:
         self.kwargs = kwargs
         self._typedefs = {}
         self._binding_codes = {}
+        self._hash = None
+        self._definitions = None
 
     def __setitem__(self, key, value):
         if hasattr(self.__class__, key):
             msg = f"Templating variable {key} causes name clash with class attribute."
             raise KeyError(msg)
+        if type(value) is str and len(value) < 64:
+            # Share one object for equal values that are built at runtime
+            value = sys.intern(value)
         self.kwargs[key] = value
+        self._hash = None
 
     def __getitem__(self, key):
         return self.kwargs[key]
 
     def hash(self):
         """A hash of the current state of the shader. If the hash changed,
-        it's likely that the shader changed.
+        it's likely that the shader changed. The hash is cached until a
+        templating variable is set or a binding is defined.
         """
-        h = hashlib.sha1()
-        h.update(repr(self.kwargs).encode())
-        h.update(self.code_definitions().encode())
-        return h.hexdigest()
+        if self._hash is None:
+            h = hashlib.blake2b(digest_size=20)
+            kwargs = self.kwargs
+            for key in sorted(kwargs):
+                value = kwargs[key]
+                h.update(key.encode() + b"=")
+                if isinstance(value, np.ndarray):
+                    # The repr of an array is slow, and abbreviated for large arrays
+                    h.update(f"{value.dtype.str}{value.shape}".encode())
+                    h.update(value.tobytes())
+                else:
+                    h.update(repr(value).encode())
+                h.update(b";")
+            h.update(self.code_definitions().encode())
+            self._hash = h.hexdigest()
+        return self._hash
 
     def code_definitions(self):
         """Get the WGSL definitions of types and bindings (uniforms, storage
         buffers, samplers, and textures).
         """
-        code = (
-            "\n".join(self._typedefs.values())
-            + "\n"
-            + "\n".join(self._binding_codes.values())
-        )
-        return code
+        if self._definitions is None:
+            self._definitions = (
+                "\n".join(self._typedefs.values())
+                + "\n"
+                + "\n".join(self._binding_codes.values())
+            )
+        return self._definitions
 
     def get_code(self):
         """Implement this to compose the total (but still templated)
@@ -289,31 +455,30 @@ class BaseShader:
         the templating variables, varyings, and depth output.
         """
 
-        old_kwargs = self.kwargs
-        self.kwargs = old_kwargs.copy()
-        self.kwargs.update(kwargs)
-
-        try:
-
-            code1 = self.get_code()
-            t = jinja_env.from_string(code1)
-
-            err_msg = None
+        if kwargs:
+            # Apply the given kwargs for this call only. Restoring the
+            # kwargs restores the state, so the cached hash stays valid.
+            old_kwargs, old_hash = self.kwargs, self._hash
+            self.kwargs = {**old_kwargs, **kwargs}
             try:
-                code2 = t.render(**self.kwargs)
-            except jinja2.UndefinedError as err:
-                err_msg = f"Canot compose shader: {err.args[0]}"
-
-            if err_msg:
-                # Don't raise within handler to avoid recursive tb
-                raise ValueError(err_msg)
-            else:
-                code2 = resolve_varyings(code2)
-                code2 = resolve_depth_output(code2)
-                return code2
+                code1 = self.get_code()
+                kwargs = self.kwargs
+            finally:
+                self.kwargs, self._hash = old_kwargs, old_hash
+        else:
+            code1 = self.get_code()
+            kwargs = self.kwargs
 
-        finally:
-            self.kwargs = old_kwargs
+        # The result is fully defined by the code and the kwargs, so we
+        # can cache it, unless there are unhashable templating variables.
+        # The key includes the types, because e.g. 1 == 1.0 == True.
+        try:
+            kwargs_key = tuple((k, v.__class__, v) for k, v in sorted(kwargs.items()))
+            hash(kwargs_key)
+        except TypeError:
+            return render_wgsl(code1, kwargs)
+        else:
+            return _render_wgsl_cached(code1, kwargs_key)
 
     def define_bindings(self, bindgroup, bindings_dict):
         """Define a collection of bindings organized in a dict."""
@@ -325,6 +490,7 @@ class BaseShader:
         will be part of the code returned by ``get_definitions()``. The binding
         must be a Binding object.
         """
+        self._hash = self._definitions = None
         if binding.type == "buffer/uniform":
             self._define_uniform(bindgroup, index, binding)
         elif binding.type.startswith("buffer"):
@@ -341,23 +507,26 @@ class BaseShader:
     def _define_uniform(self, bindgroup, index, binding):
 
         structname = "Struct_" + binding.name
-        code = f"""
+        field_lines = [
+            f"""
         struct {structname} {{
         """.rstrip()
+        ]
 
         resource = binding.resource
-        if isinstance(resource, dict):
-            dtype_struct = array_from_shadertype(resource).dtype
-        elif isinstance(resource, Buffer):
-            if resource.data.dtype.fields is None:
-                raise TypeError(f"define_uniform() needs a structured dtype")
-            dtype_struct = resource.data.dtype
-        elif isinstance(resource, np.dtype):
-            if resource.fields is None:
-                raise TypeError(f"define_uniform() needs a structured dtype")
-            dtype_struct = resource
-        else:
-            raise TypeError(f"Unsupported struct type {resource.__class__.__name__}")
+        func = _struct_dtype_funcs.get(resource.__class__, None)
+        if func is None:
+            # Subclasses (e.g. np.dtype has a subclass per kind) are
+            # resolved via isinstance, and then added to the dict.
+            for cls, func in _struct_dtype_funcs.items():
+                if isinstance(resource, cls):
+                    break
+            else:
+                raise TypeError(
+                    f"Unsupported struct type {resource.__class__.__name__}"
+                )
+            _struct_dtype_funcs[resource.__class__] = func
+        dtype_struct = func(resource)
 
         # Obtain names of fields that are arrays. This is encoded as an empty field with a
         # name that has the array-fields-names separated with double underscores.
@@ -385,13 +554,15 @@ class BaseShader:
             # Obtain base type
             if shape == () or shape == (1,):
                 # A scalar
-                wgsl_type = align_type = primitive_type
+                wgsl_type = primitive_type
+                align_n = 1
             elif len(shape) == 1:
                 # A vector
                 n = shape[0]
                 if n < 2 or n > 4:
                     raise TypeError(f"Type {dtype} looks like an unsupported vec{n}.")
-                wgsl_type = align_type = f"vec{n}<{primitive_type}>"
+                wgsl_type = f"vec{n}<{primitive_type}>"
+                align_n = n
             elif len(shape) == 2:
                 # A matNxM is Matrix of N columns and M rows
                 n, m = shape[1], shape[0]
@@ -399,38 +570,30 @@ class BaseShader:
                     raise TypeError(
                         f"Type {dtype} looks like an unsupported mat{n}x{m}."
                     )
-                align_type = f"vec{m}<primitive_type>"
                 wgsl_type = f"mat{n}x{m}<{primitive_type}>"
+                align_n = m  # aligns like its column vectors
             else:
                 raise TypeError(f"Unsupported type {dtype}")
             # If an array, wrap it
             if length == 0:
-                wgsl_type = align_type = None  # zero-length; dont use
+                continue  # zero-length; dont use
             elif length > 0:
                 wgsl_type = f"array<{wgsl_type},{length}>"
             else:
                 pass  # not an array
 
             # Check alignment (https://www.w3.org/TR/WGSL/#alignment-and-size)
-            if not wgsl_type:
-                continue
-            elif align_type == primitive_type:
-                alignment = 4
-            elif align_type.startswith("vec"):
-                c = int(align_type.split("<")[0][-1])
-                alignment = 8 if c < 3 else 16
-            else:
-                raise TypeError(f"Cannot establish alignment of wgsl type: {wgsl_type}")
+            alignment = _alignments[align_n]
             if offset % alignment != 0:
                 # If this happens, our array_from_shadertype() has failed.
                 raise TypeError(
                     f"Struct alignment error: {binding.name}.{fieldname} alignment must be {alignment}"
                 )
 
-            code += f"\n            {fieldname}: {wgsl_type},"
+            field_lines.append(f"            {fieldname}: {wgsl_type},")
 
-        code += "\n        };"
-        self._typedefs[structname] = code
+        field_lines.append("        };")
+        self._typedefs[structname] = "\n".join(field_lines)
 
         code = f"""
         @group({bindgroup}) @binding({index})
@@ -440,59 +603,25 @@ class BaseShader:
 
     def _define_buffer(self, bindgroup, index, binding):
 
-        # Get format, and split in the scalar part and the number of channels
-        fmt = to_vertex_format(binding.resource.format)
-        if "x" in fmt:
-            fmt_scalar, _, nchannels = fmt.partition("x")
-            nchannels = int(nchannels)
-        else:
-            fmt_scalar = fmt
-            nchannels = 1
-
-        # Define scalar type: i32, u32 or f32
-        # Since the stride must be a multiple of 4 for storage buffers,
-        # the supported types is limited until we support structured numpy arrays.
-        scalar_type = (
-            fmt_scalar.replace("float", "f").replace("uint", "u").replace("sint", "i")
+        nchannels, element_type1, element_type2 = _get_storage_element_types(
+            binding.resource.format
         )
-        if not scalar_type.endswith("32"):
-            raise ValueError(
-                f"Buffer format {format} not supported, format must have a stride of 4 bytes: i4, u4 of f4."
-            )
-
-        # Define the element types. The element_type2 is the actual type.
-        # Because for storage buffers a vec3 has an alignment of 16, we have to
-        # be creative for vec3: we bind the buffer as if it was 1D, and convert
-        # in the accessor function.
-        if nchannels == 1:
-            element_type1 = element_type2 = scalar_type
-            stride = 4
-        elif nchannels == 3:
-            element_type1 = scalar_type
-            element_type2 = f"vec{nchannels}<{scalar_type}>"
-            stride = 4
-        else:
-            element_type1 = element_type2 = f"vec{nchannels}<{scalar_type}>"
-            stride = 4 * nchannels
-
-        stride  # not actually used anymore in wgsl?
 
         # Produce the binding code and accessor function
         type_modifier = "read" if "read_only" in binding.type else "read_write"
+        if element_type1 == element_type2:
+            body = f"return {binding.name}[i];"
+        else:
+            elements = ", ".join(
+                f"{binding.name}[i * {nchannels}{f' + {c}' if c else ''}]"
+                for c in range(nchannels)
+            )
+            body = f"return {element_type2}( {elements} );"
         code = f"""
         @group({bindgroup}) @binding({index})
         var<storage, {type_modifier}> {binding.name}: array<{element_type1}>;
-        fn load_{binding.name} (i: i32) -> {element_type2} {{
+        fn load_{binding.name} (i: i32) -> {element_type2} {{ {body} }}
         """.rstrip()
-        if element_type1 == element_type2:
-            code += f" return {binding.name}[i];"
-        elif nchannels == 2:
-            code += f" return {element_type2}( {binding.name}[i * 2], {binding.name}[i * 2 + 1] );"
-        elif nchannels == 3:
-            code += f" return {element_type2}( {binding.name}[i * 3], {binding.name}[i * 3 + 1], {binding.name}[i * 3 + 2] );"
-        else:  # nchannels == 4
-            code += f" return {element_type2}( {binding.name}[i * 4], {binding.name}[i * 4 + 1], {binding.name}[i * 4 + 2], {binding.name}[i * 4 + 3] );"
-        code += " }"
         self._binding_codes[binding.name] = code
 
     def _define_sampler(self, bindgroup, index, binding):
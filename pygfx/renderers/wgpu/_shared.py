@@ -11,15 +11,19 @@ from ...utils import array_from_shadertype
 
 # Definition uniform struct with standard info related to transforms,
 # provided to each shader as uniform at slot 0.
-# todo: a combined transform would be nice too, for performance
-# todo: same for ndc_to_world transform (combined inv transforms)
+# The projection_cam_transform is the combined projection_transform *
+# cam_transform, and projection_cam_transform_inv is its inverse (for
+# ndc-to-world), so that shaders need one matrix multiply instead of two.
 stdinfo_uniform_type = dict(
     cam_transform="4x4xf4",
     cam_transform_inv="4x4xf4",
     projection_transform="4x4xf4",
     projection_transform_inv="4x4xf4",
+    projection_cam_transform="4x4xf4",
+    projection_cam_transform_inv="4x4xf4",
     physical_size="2xf4",
     logical_size="2xf4",
+    inv_half_logical_size="2xf4",  # 2 / logical_size, to multiply instead of divide
     flipped_winding="i4",  # A bool, really
 )
 
@@ -2,6 +2,8 @@
 Utils for the wgpu renderer.
 """
 
+from functools import lru_cache
+
 import wgpu
 
 from .. import RenderFunctionRegistry
@@ -20,6 +22,7 @@ def register_wgpu_render_function(wobject_cls, material_cls):
     return _register_wgpu_renderer
 
 
+@lru_cache(maxsize=None)
 def to_vertex_format(format):
     """Convert pygfx' own format to the wgpu format."""
     if format in wgpu.VertexFormat:
@@ -52,6 +55,7 @@ def to_vertex_format(format):
         raise ValueError(f"Unexpected length of index/vertex format '{format}'")
 
 
+@lru_cache(maxsize=None)
 def to_texture_format(format):
     """Convert pygfx' own format to the wgpu format."""
     if format in wgpu.TextureFormat:
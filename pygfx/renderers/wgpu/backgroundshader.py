@@ -69,11 +69,13 @@ class BackgroundShader(WorldObjectShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -186,12 +186,14 @@ class ImageShader(BaseImageShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_image_helpers()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_image_helpers(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -214,7 +216,7 @@ class ImageShader(BaseImageShader):
             // Sample position, and convert to world pos, and then to ndc
             let data_pos = vec4<f32>(geo.positions[i0], 1.0);
             let world_pos = u_wobject.world_transform * data_pos;
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             var varyings: Varyings;
             varyings.position = vec4<f32>(ndc_pos);
@@ -242,11 +244,11 @@ class ImageShader(BaseImageShader):
 
             $$ if write_pick
             // The wobject-id must be 20 bits. In total it must not exceed 64 bits.
-            out.pick = (
-                pick_pack(u32(u_wobject.id), 20) +
-                pick_pack(u32(varyings.texcoord.x * 4194304.0), 22) +
-                pick_pack(u32(varyings.texcoord.y * 4194304.0), 22)
-            );
+            out.pick = {{ pick_pack(
+                ("u32(u_wobject.id)", 20),
+                ("u32(varyings.texcoord.x * 4194304.0)", 22),
+                ("u32(varyings.texcoord.y * 4194304.0)", 22),
+            ) }};
             $$ endif
 
             return out;
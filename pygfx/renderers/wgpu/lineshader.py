@@ -158,13 +158,15 @@ class LineShader(WorldObjectShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_more_definitions()
-            + self.code_common()
-            + self.code_helpers()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_more_definitions(),
+                self.code_common(),
+                self.code_helpers(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_more_definitions(self):
@@ -196,7 +198,7 @@ class LineShader(WorldObjectShader):
         fn get_point_ndc(index:i32) -> vec4<f32> {
             let raw_pos = load_s_positions(index);
             let world_pos = u_wobject.world_transform * vec4<f32>(raw_pos.xyz, 1.0);
-            return u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            return u_stdinfo.projection_cam_transform * world_pos;
         }
         """
 
@@ -432,11 +434,11 @@ class LineShader(WorldObjectShader):
             var coord = select(varyings.pick_zigzag, 1.0 - varyings.pick_zigzag, is_even);
             coord = select(coord, coord - 1.0, coord > 0.5);
             let idx = varyings.pick_idx + select(0u, 1u, coord < 0.0);
-            out.pick = (
-                pick_pack(u32(u_wobject.id), 20) +
-                pick_pack(u32(idx), 26) +
-                pick_pack(u32(coord * 100000.0 + 100000.0), 18)
-            );
+            out.pick = {{ pick_pack(
+                ("u32(u_wobject.id)", 20),
+                ("u32(idx)", 26),
+                ("u32(coord * 100000.0 + 100000.0)", 18),
+            ) }};
             $$ endif
 
             // The outer edges with lower alpha for aa are pushed a bit back to avoid artifacts.
@@ -645,11 +647,13 @@ class ThinLineShader(WorldObjectShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -679,7 +683,7 @@ class ThinLineShader(WorldObjectShader):
         fn vs_main(in: VertexInput) -> Varyings {
 
             let wpos = u_wobject.world_transform * vec4<f32>(in.pos.xyz, 1.0);
-            let npos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * wpos;
+            let npos = u_stdinfo.projection_cam_transform * wpos;
 
             var varyings: Varyings;
             varyings.position = vec4<f32>(npos);
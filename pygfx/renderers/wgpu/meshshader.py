@@ -169,12 +169,14 @@ class MeshShader(WorldObjectShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_helpers()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_helpers(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -224,14 +226,14 @@ class MeshShader(WorldObjectShader):
             // Get vertex position
             let raw_pos = load_s_positions(i0);
             let world_pos = world_transform * vec4<f32>(raw_pos, 1.0);
-            var ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            var ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             // For the wireframe we also need the ndc_pos of the other vertices of this face
             $$ if wireframe
                 $$ for i in (1, 2, 3)
                     let raw_pos{{ i }} = load_s_positions(i32(ii[{{ i - 1 }}]));
                     let world_pos{{ i }} = world_transform * vec4<f32>(raw_pos{{ i }}, 1.0);
-                    let ndc_pos{{ i }} = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos{{ i }};
+                    let ndc_pos{{ i }} = u_stdinfo.projection_cam_transform * world_pos{{ i }};
                 $$ endfor
                 let depth_offset = -0.0001;  // to put the mesh slice atop a mesh
                 ndc_pos.z = ndc_pos.z + depth_offset;
@@ -354,13 +356,13 @@ class MeshShader(WorldObjectShader):
 
             $$ if write_pick
             // The wobject-id must be 20 bits. In total it must not exceed 64 bits.
-            out.pick = (
-                pick_pack(varyings.pick_id, 20) +
-                pick_pack(varyings.pick_idx, 26) +
-                pick_pack(u32(varyings.pick_coords.x * 64.0), 6) +
-                pick_pack(u32(varyings.pick_coords.y * 64.0), 6) +
-                pick_pack(u32(varyings.pick_coords.z * 64.0), 6)
-            );
+            out.pick = {{ pick_pack(
+                ("varyings.pick_id", 20),
+                ("varyings.pick_idx", 26),
+                ("u32(varyings.pick_coords.x * 64.0)", 6),
+                ("u32(varyings.pick_coords.y * 64.0)", 6),
+                ("u32(varyings.pick_coords.z * 64.0)", 6),
+            ) }};
             $$ endif
 
             return out;
@@ -509,7 +511,7 @@ class MeshNormalLinesShader(MeshShader):
 
             let amplitude = 1.0;
             let world_pos = world_pos1 + f32(r) * world_normal * amplitude;
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             var varyings: Varyings;
             varyings.world_pos = vec3<f32>(world_pos.xyz / world_pos.w);
@@ -595,11 +597,13 @@ class MeshSliceShader(WorldObjectShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -662,7 +666,7 @@ class MeshSliceShader(WorldObjectShader):
             var pick_coords = vec3<f32>(0.0);
             if (pos_index < 3) {//   (pos_index < 3) {  // or dot(n, u) == 0.0
                 // Just return the same vertex, resulting in degenerate triangles
-                the_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * vec4<f32>(pos1, 1.0);
+                the_pos = u_stdinfo.projection_cam_transform * vec4<f32>(pos1, 1.0);
                 the_coord = vec2<f32>(0.0, 0.0);
                 segment_length = 0.0;
             } else {
@@ -687,8 +691,8 @@ class MeshSliceShader(WorldObjectShader):
                 let fw_a = fws_a[pos_index];
                 let fw_b = fws_b[pos_index];
                 // Go from local coordinates to NDC
-                var npos_a: vec4<f32> = u_stdinfo.projection_transform * u_stdinfo.cam_transform * vec4<f32>(pos_a, 1.0);
-                var npos_b: vec4<f32> = u_stdinfo.projection_transform * u_stdinfo.cam_transform * vec4<f32>(pos_b, 1.0);
+                var npos_a: vec4<f32> = u_stdinfo.projection_cam_transform * vec4<f32>(pos_a, 1.0);
+                var npos_b: vec4<f32> = u_stdinfo.projection_cam_transform * vec4<f32>(pos_b, 1.0);
                 // Don't forget to "normalize"!
                 // todo: omitting this step diminish the thickness with distance, but it that the way?
                 npos_a = npos_a / npos_a.w;
@@ -765,13 +769,13 @@ class MeshSliceShader(WorldObjectShader):
             var out = get_fragment_output(varyings.position.z, final_color);
             $$ if write_pick
             // The wobject-id must be 20 bits. In total it must not exceed 64 bits.
-            out.pick = (
-                pick_pack(u32(u_wobject.id), 20) +
-                pick_pack(varyings.pick_idx, 26) +
-                pick_pack(u32(varyings.pick_coords.x * 64.0), 6) +
-                pick_pack(u32(varyings.pick_coords.y * 64.0), 6) +
-                pick_pack(u32(varyings.pick_coords.z * 64.0), 6)
-            );
+            out.pick = {{ pick_pack(
+                ("u32(u_wobject.id)", 20),
+                ("varyings.pick_idx", 26),
+                ("u32(varyings.pick_coords.x * 64.0)", 6),
+                ("u32(varyings.pick_coords.y * 64.0)", 6),
+                ("u32(varyings.pick_coords.z * 64.0)", 6),
+            ) }};
             $$ endif
             return out;
         }
@@ -107,11 +107,13 @@ class PointsShader(WorldObjectShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -131,7 +133,7 @@ class PointsShader(WorldObjectShader):
 
             let raw_pos = load_s_positions(i0);
             let world_pos = u_wobject.world_transform * vec4<f32>(raw_pos, 1.0);
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             var deltas = array<vec2<f32>, 6>(
                 vec2<f32>(-1.0, -1.0),
@@ -244,12 +246,12 @@ class PointsShader(WorldObjectShader):
 
             $$ if write_pick
             // The wobject-id must be 20 bits. In total it must not exceed 64 bits.
-            out.pick = (
-                pick_pack(u32(u_wobject.id), 20) +
-                pick_pack(varyings.pick_idx, 26) +
-                pick_pack(u32(varyings.pointcoord.x + 256.0), 9) +
-                pick_pack(u32(varyings.pointcoord.y + 256.0), 9)
-            );
+            out.pick = {{ pick_pack(
+                ("u32(u_wobject.id)", 20),
+                ("varyings.pick_idx", 26),
+                ("u32(varyings.pointcoord.x + 256.0)", 9),
+                ("u32(varyings.pointcoord.y + 256.0)", 9),
+            ) }};
             $$ endif
 
             return out;
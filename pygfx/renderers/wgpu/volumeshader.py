@@ -158,12 +158,14 @@ class VolumeSliceShader(BaseVolumeShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_volume_helpers()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_volume_helpers(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -313,7 +315,7 @@ class VolumeSliceShader(BaseVolumeShader):
             let index = i32(in.vertex_index);
             var indexmap = array<i32,12>(0, 1, 2, 0, 2, 3, 0, 3, 4, 0, 4, 5);
             let world_pos = vertices[ indexmap[index] ];
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * vec4<f32>(world_pos, 1.0);
+            let ndc_pos = u_stdinfo.projection_cam_transform * vec4<f32>(world_pos, 1.0);
 
             var varyings : Varyings;
             varyings.position = vec4<f32>(ndc_pos);
@@ -340,12 +342,12 @@ class VolumeSliceShader(BaseVolumeShader):
 
             $$ if write_pick
             // The wobject-id must be 20 bits. In total it must not exceed 64 bits.
-            out.pick = (
-                pick_pack(u32(u_wobject.id), 20) +
-                pick_pack(u32(varyings.texcoord.x * 16384.0), 14) +
-                pick_pack(u32(varyings.texcoord.y * 16384.0), 14) +
-                pick_pack(u32(varyings.texcoord.z * 16384.0), 14)
-            );
+            out.pick = {{ pick_pack(
+                ("u32(u_wobject.id)", 20),
+                ("u32(varyings.texcoord.x * 16384.0)", 14),
+                ("u32(varyings.texcoord.y * 16384.0)", 14),
+                ("u32(varyings.texcoord.z * 16384.0)", 14),
+            ) }};
             $$ endif
 
             return out;
@@ -387,13 +389,15 @@ class VolumeRayShader(BaseVolumeShader):
         }
 
     def get_code(self):
-        return (
-            self.code_definitions()
-            + self.code_common()
-            + self.code_volume_helpers()
-            + self.code_render_function()
-            + self.code_vertex()
-            + self.code_fragment()
+        return "".join(
+            (
+                self.code_definitions(),
+                self.code_common(),
+                self.code_volume_helpers(),
+                self.code_render_function(),
+                self.code_vertex(),
+                self.code_fragment(),
+            )
         )
 
     def code_vertex(self):
@@ -416,10 +420,10 @@ class VolumeRayShader(BaseVolumeShader):
             // Sample position, and convert to world pos, and then to ndc
             let data_pos = vec4<f32>(geo.positions[i0], 1.0);
             let world_pos = u_wobject.world_transform * data_pos;
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             // Prepare inverse matrix
-            let ndc_to_data = u_wobject.world_transform_inv * u_stdinfo.cam_transform_inv * u_stdinfo.projection_transform_inv;
+            let ndc_to_data = u_wobject.world_transform_inv * u_stdinfo.projection_cam_transform_inv;
 
             var varyings: Varyings;
 
@@ -501,7 +505,7 @@ class VolumeRayShader(BaseVolumeShader):
             // Get world and ndc pos from the calculatex texture coordinate
             let data_pos = render_out.coord * sizef - vec3<f32>(0.5, 0.5, 0.5);
             let world_pos = u_wobject.world_transform * vec4<f32>(data_pos, 1.0);
-            let ndc_pos = u_stdinfo.projection_transform * u_stdinfo.cam_transform * world_pos;
+            let ndc_pos = u_stdinfo.projection_cam_transform * world_pos;
 
             // Maybe we did the work for nothing
             apply_clipping_planes(world_pos.xyz);
@@ -514,12 +518,12 @@ class VolumeRayShader(BaseVolumeShader):
 
             $$ if write_pick
             // The wobject-id must be 20 bits. In total it must not exceed 64 bits.
-            out.pick = (
-                pick_pack(u32(u_wobject.id), 20) +
-                pick_pack(u32(render_out.coord.x * 16384.0), 14) +
-                pick_pack(u32(render_out.coord.y * 16384.0), 14) +
-                pick_pack(u32(render_out.coord.z * 16384.0), 14)
-            );
+            out.pick = {{ pick_pack(
+                ("u32(u_wobject.id)", 20),
+                ("u32(render_out.coord.x * 16384.0)", 14),
+                ("u32(render_out.coord.y * 16384.0)", 14),
+                ("u32(render_out.coord.z * 16384.0)", 14),
+            ) }};
             $$ endif
             return out;
         }
@@ -155,11 +155,12 @@ class Buffer(Resource):
             raise ValueError("Update offset must not be negative")
         elif offset + size > self.nitems:
             size = self.nitems - offset
-        # Merge with current entry?
+        # Merge with current entry, so that subsequent updates result in a single upload
         if self._pending_uploads:
             cur_offset, cur_size = self._pending_uploads.pop(-1)
+            end = max(offset + size, cur_offset + cur_size)
             offset = min(offset, cur_offset)
-            size = max(size, cur_size)
+            size = end - offset
         # Limit and apply
         self._pending_uploads.append((offset, size))
         self._rev += 1
@@ -78,6 +78,9 @@ def array_from_shadertype(shadertype):
     dtype_fields.append(("__".join(array_names), "uint8", (0,)))
 
     # Add padding: uniform buffers must align to 16 bytes.
+    # Note that the 256-byte minUniformBufferOffsetAlignment does not apply,
+    # because each uniform buffer is bound as a whole (at offset 0, without
+    # dynamic offsets), and uploaded directly from this array.
     size = np.dtype(dtype_fields).itemsize
     n16 = int(np.ceil(size / 16))
     padding = n16 * 16 - size
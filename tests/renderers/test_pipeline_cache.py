@@ -0,0 +1,90 @@
+from pygfx.renderers.wgpu import _shaderbase as shadercomposer
+from pygfx.renderers.wgpu._pipeline import Cache
+
+
+class FakeObject:
+    pass
+
+
+class FakeDevice:
+    def __init__(self):
+        self.count = 0
+
+    def create_shader_module(self, code):
+        self.count += 1
+        return FakeObject()
+
+
+def test_shader_module_from_shader():
+    class MyShader(shadercomposer.BaseShader):
+
+        n_generated = 0
+
+        def get_code(self):
+            MyShader.n_generated += 1
+            return "x = {{bar}} {{foo}}"
+
+    cache = Cache()
+    device = FakeDevice()
+
+    shader1 = MyShader(bar=1)
+    m1 = cache.get_shader_module_from_shader(device, shader1, foo=1)
+    assert MyShader.n_generated == 1
+    assert device.count == 1
+
+    # A shader with the same state re-uses the module, without generating wgsl
+    shader2 = MyShader(bar=1)
+    m2 = cache.get_shader_module_from_shader(device, shader2, foo=1)
+    assert m2 is m1
+    assert MyShader.n_generated == 1
+    assert device.count == 1
+
+    # Different extra kwargs produce a different module
+    m3 = cache.get_shader_module_from_shader(device, shader2, foo=2)
+    assert m3 is not m1
+    assert MyShader.n_generated == 2
+    assert device.count == 2
+
+    # Different state produces a different module
+    shader2["bar"] = 2
+    m4 = cache.get_shader_module_from_shader(device, shader2, foo=1)
+    assert m4 is not m1
+    assert MyShader.n_generated == 3
+    assert device.count == 3
+
+    # Different state, but equal wgsl, re-uses the module via the source
+    shader3 = MyShader(bar=1, spam=1)
+    m5 = cache.get_shader_module_from_shader(device, shader3, foo=1)
+    assert m5 is m1
+    assert MyShader.n_generated == 4
+    assert device.count == 3
+
+
+def test_cache_releases_unused_objects():
+    cache = Cache(hot_size=2)
+
+    obs = [FakeObject() for i in range(4)]
+    for i, ob in enumerate(obs):
+        cache.set(i, ob)
+    assert all(cache.get(i) is ob for i, ob in enumerate(obs))
+
+    # Only the hot objects are kept alive by the cache
+    del ob, obs
+    assert cache.get(0) is None
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    assert cache.get(3) is not None
+
+    # Using an object keeps it hot
+    cache.get(2)
+    cache.set(4, FakeObject())
+    assert cache.get(3) is None
+    assert cache.get(2) is not None
+    assert cache.get(4) is not None
+
+    # Objects that are used elsewhere stay available
+    ob = FakeObject()
+    cache.set(5, ob)
+    cache.set(6, FakeObject())
+    cache.set(7, FakeObject())
+    assert cache.get(5) is ob
@@ -1,5 +1,9 @@
+import re
+
 from pygfx.renderers.wgpu import _shaderbase as shadercomposer
 from pygfx.renderers.wgpu import Binding
+from pygfx.renderers.wgpu._shader import _pick_pack
+from pygfx.utils import unpack_bitfield
 from pytest import raises
 import numpy as np
 
@@ -64,6 +68,105 @@ def test_logic_beyond_templating():
     assert shader.generate_wgsl().strip() == "x = 25"
 
 
+def test_templating_cache():
+    class MyShader(shadercomposer.BaseShader):
+        def get_code(self):
+            return "x = {{bar}}"
+
+    # Values that compare equal but render differently are not mixed up
+    shader = MyShader(bar=1)
+    assert shader.generate_wgsl().strip() == "x = 1"
+    assert shader.generate_wgsl(bar=1.0).strip() == "x = 1.0"
+    assert shader.generate_wgsl(bar=True).strip() == "x = True"
+
+    # Unhashable values are supported too
+    assert shader.generate_wgsl(bar=[1, 2]).strip() == "x = [1, 2]"
+
+
+def test_templating_str_subclass():
+    class MyStr(str):
+        pass
+
+    shader = shadercomposer.BaseShader()
+    shader["color_mode"] = np.str_("vertex")
+    shader["mode"] = MyStr("iso")
+    assert shader["color_mode"] == "vertex"
+    assert shader["mode"] == "iso"
+    assert isinstance(shader.hash(), str)
+
+
+def _eval_pick_pack(values, bit_counts):
+    # Evaluate the wgsl produced by _pick_pack() as a Python expression
+    fields = [(f"v{i}", bits) for i, bits in enumerate(bit_counts)]
+    code = _pick_pack(*fields)
+    code = re.sub(r"(\d+)u\b", r"\1", code.replace("vec4<u32>", ""))
+    components = eval(code, {f"v{i}": v for i, v in enumerate(values)})
+    assert all(0 <= c < 2**16 for c in components)
+    return sum(c << (16 * i) for i, c in enumerate(components))
+
+
+def test_pick_pack():
+    layouts = [
+        (20, 26, 6, 6, 6),  # builtin layout, fields straddle components
+        (20, 26, 18),
+        (16, 16, 16, 16),  # aligned with the components
+        (32, 32),
+        (3, 5),
+    ]
+    for bit_counts in layouts:
+        # Max values, zeros, and a mixed pattern
+        for values in [
+            [2**bits - 1 for bits in bit_counts],
+            [0 for bits in bit_counts],
+            [(0x5A5A5A5A >> i) % 2**bits for i, bits in enumerate(bit_counts)],
+        ]:
+            packed = _eval_pick_pack(values, bit_counts)
+            names = {f"v{i}": bits for i, bits in enumerate(bit_counts)}
+            unpacked = unpack_bitfield(packed, **names)
+            assert list(unpacked.values()) == values
+
+    # Values that are too large are clipped, not leaked into the next field
+    packed = _eval_pick_pack([2**20, 1], (20, 26))
+    assert unpack_bitfield(packed, a=20, b=26) == {"a": 2**20 - 1, "b": 1}
+
+    # Too many bits in total
+    with raises(ValueError):
+        _pick_pack(("a", 32), ("b", 32), ("c", 1))
+
+    # Fields must fit in a u32
+    with raises(ValueError):
+        _pick_pack(("a", 33))
+    with raises(ValueError):
+        _pick_pack(("a", 0))
+
+
+def test_hash():
+    class MyShader(shadercomposer.BaseShader):
+        def get_code(self):
+            self["spam"] = 1
+            return "x = {{bar}}"
+
+    shader = MyShader(bar=1)
+    h1 = shader.hash()
+    assert shader.hash() == h1
+
+    # Setting a templating variable changes the hash
+    shader["bar"] = 2
+    h2 = shader.hash()
+    assert h2 != h1
+
+    # Defining a binding changes the hash
+    shader.define_binding(0, 0, Binding("u_foo", "buffer/uniform", dict(foo="f4")))
+    h3 = shader.hash()
+    assert h3 != h2
+
+    # Variables set during generate_wgsl() do not affect the hash,
+    # and do not cause it to be recomputed
+    shader.generate_wgsl(bar=3)
+    assert shader._hash == h3
+    assert shader.hash() == h3
+
+
 def test_uniform_definitions():
     class MyShader(shadercomposer.BaseShader):
         def get_code(self):
@@ -0,0 +1,21 @@
+import numpy as np
+
+import pygfx as gfx
+
+
+def test_buffer_update_range_merges():
+    buffer = gfx.Buffer(np.zeros((10, 3), np.float32))
+    assert buffer._pending_uploads == [(0, 10)]
+    buffer._pending_uploads = []
+
+    # Subsequent updates are merged into a single upload
+    buffer.update_range(2, 1)
+    assert buffer._pending_uploads == [(2, 1)]
+    buffer.update_range(5, 2)
+    assert buffer._pending_uploads == [(2, 5)]
+    buffer.update_range(0, 1)
+    assert buffer._pending_uploads == [(0, 7)]
+
+    # Clipped to the size of the buffer
+    buffer.update_range(8, 99999)
+    assert buffer._pending_uploads == [(0, 10)]